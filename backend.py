@@ -1,24 +1,32 @@
 import os
 import json
-import re
-import subprocess
+import time
 import dateparser
-from datetime import datetime
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict
 
 # RAG imports
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
 # Graph imports
-from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.vectorstores import Neo4jVector
 from langchain_neo4j import Neo4jVector
 
+# Structured filters over posting lists
+from log_index import INDEXED_FIELDS, extract_filters
+from embeddings import BatchedEmbeddings, get_encoder, loaded_models, query_cache
+from rag_index import RagIndex
+from index_types import filtered_search
+from bm25 import reciprocal_rank_fusion
+
+# LLM client and executors for blocking work
+from llm_client import ollama, ask_ollama
+import executors
+from executors import run_cpu, run_io
+
 # CrewAI imports
 import sys
 sys.path.append('./crewAI')
@@ -27,13 +35,20 @@ from crewai_agent import run_crewai_query
 # -------- CONFIG --------
 DATA_PATH = "data.json"
 INDEX_PATH = "vector.index"
-DOC_STORE_PATH = "data_store.json"
+DOC_STORE_PATH = "data_store"  # memory-mapped columnar doc store directory
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 LOCAL_MODEL_PATH = "all-MiniLM-L6-v2"
 NEO4J_URL = "neo4j://127.0.0.1:7687"
 NEO4J_USERNAME = "neo4j"
 NEO4J_PASSWORD = "purva@1234"
 COLLECTION_NAME = "vectorbot"
+# Structured filters the unified backend extracts from questions; matching rows
+# are then ranked by vector similarity
+FILTER_FIELDS = INDEXED_FIELDS
+# Number of retrieved entries placed in the LLM prompt
+PROMPT_ENTRIES = 5
+# Candidates taken from each of the dense and BM25 rankings before fusion
+RETRIEVAL_TOP_K = 10
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -57,50 +72,9 @@ def normalize_dates(text):
     parsed = dateparser.parse(text)
     return parsed.strftime("%Y-%m-%d") if parsed else text
 
-def ask_ollama(prompt: str, model: str) -> str:
-    result = subprocess.run(["ollama", "run", model], input=prompt.encode(), stdout=subprocess.PIPE)
-    return result.stdout.decode().strip()
-
-def load_json_data():
-    with open(DATA_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-# Initialize systems
-try:
-    # RAG system initialization
-    if not os.path.exists(INDEX_PATH):
-        print("Building RAG index...")
-        raw_data = load_json_data()
-        entries = []
-        for d in raw_data:
-            date = d.get("RecordDate", "unknown date")
-            time = d.get("Time", "")
-            hour = int(datetime.strptime(time, "%H:%M:%S").hour) if time else None
-            part = (
-                "morning" if 5 <= hour < 12 else
-                "afternoon" if 12 <= hour < 17 else
-                "evening" if 17 <= hour < 21 else
-                "night"
-            ) if hour is not None else ""
-            entry = f"""On {d.get("DayOfWeek", "")}, {date} at {d.get("SiteDetails", "")} ({d.get("Floor", "")}, {d.get("LocationCode", "").replace("LOC-IN-", "")}), WiFi count: {d.get("WiFiCount", "N/A")}, Access count: {d.get("AccessControlCount", "N/A")}, Type: {d.get("DayType", "")}, TimeSlot: {d.get("TimeSlot", "")}. Part of day: {part}."""
-            entries.append(entry)
-        
-        model = SentenceTransformer(LOCAL_MODEL_PATH)
-        vectors = model.encode(entries, normalize_embeddings=True)
-        index = faiss.IndexFlatIP(len(vectors[0]))
-        index.add(np.array(vectors))
-        faiss.write_index(index, INDEX_PATH)
-        with open(DOC_STORE_PATH, "w") as f:
-            json.dump(raw_data, f)
-    
-    # Load RAG components
-    rag_index = faiss.read_index(INDEX_PATH)
-    with open(DOC_STORE_PATH, "r") as f:
-        rag_docs = json.load(f)
-    rag_model = SentenceTransformer(LOCAL_MODEL_PATH)
-    
-    # Graph system initialization
-    embeddings = HuggingFaceEmbeddings(model_name=LOCAL_MODEL_PATH)
+def init_graph():
+    """Neo4j vector store retriever; holds its own driver connections, so one per process."""
+    embeddings = BatchedEmbeddings(get_encoder(LOCAL_MODEL_PATH))
     graph_vectorstore = Neo4jVector.from_texts(
         texts=[],
         embedding=embeddings,
@@ -112,152 +86,273 @@ try:
         node_label="LogEntry",
         text_node_property="text",
     )
-    graph_retriever = graph_vectorstore.as_retriever()
-    graph_docs = load_json_data()
-    
+    return graph_vectorstore.as_retriever()
+
+# Initialize systems
+# The RAG index is rebuilt in the background and hot-swapped when data.json,
+# the embedding model or the entry template change
+rag = RagIndex(DATA_PATH, INDEX_PATH, DOC_STORE_PATH, LOCAL_MODEL_PATH)
+try:
+    # RAG system initialization
+    rag.open()
+    rag.start_watcher()
+    # One shared model instance; concurrent query encodes are micro-batched onto it
+    rag_model = rag.encoder
 except Exception as e:
-    print(f"Error initializing systems: {e}")
-    rag_index = None
-    rag_docs = []
+    print(f"Error initializing RAG: {e}")
     rag_model = None
+
+# Graph system initialization, in its own try so a Neo4j outage leaves dense
+# RAG retrieval working. Graph filters read the same records as RAG:
+# rag.current holds the one columnar dataset with its posting lists and
+# renderings for this process
+try:
+    graph_retriever = init_graph()
+except Exception as e:
+    print(f"Error initializing graph store: {e}")
     graph_retriever = None
-    graph_docs = []
+
+def after_fork(threads, reload_interval, owner=True):
+    """Per-worker setup when forked from a master that already loaded everything (prefork.py).
+
+    Model weights, index and dataset are inherited copy-on-write. Thread pools
+    are sized per worker, and the Neo4j driver and RAG watcher thread, which
+    cannot be shared across fork, are created fresh here. Only the `owner`
+    worker's watcher rebuilds the RAG index; the others reload what it wrote.
+    """
+    global graph_retriever
+    if threads:
+        import torch
+        import faiss
+        torch.set_num_threads(threads)
+        faiss.omp_set_num_threads(threads)
+    if graph_retriever is not None:
+        try:
+            graph_retriever = init_graph()
+        except Exception as e:
+            print(f"Error reconnecting graph store: {e}")
+            graph_retriever = None
+    rag.set_owner(owner)
+    rag.start_watcher(reload_interval)
 
 # RAG functions
-def search_rag(query, model, index, docs, top_k=10):
-    if not model or not index:
+def search_rag(qv, index, top_k=10, vids=None, prefilter=None):
+    """Dense vector ids by similarity to the query vector `qv`; restricted to `vids` when given.
+
+    With a BinaryPrefilter, unfiltered searches scan its binary codes and
+    re-rank the candidates exactly instead of searching `index` directly.
+    """
+    if qv is None or not index:
         return []
-    qv = model.encode([query], normalize_embeddings=True)[0]
-    if top_k > len(docs):
-        top_k = len(docs)
+    if vids is not None:
+        return filtered_search(index, qv, vids, top_k)
+    if prefilter is not None:
+        return prefilter.search(index, qv, top_k)
+    top_k = min(top_k, index.ntotal)
     D, I = index.search(np.array([qv]), top_k)
     unique_indices = []
     seen = set()
     for i in I[0]:
-        if i not in seen and i < len(docs):
+        if i not in seen and 0 <= i < index.ntotal:
             unique_indices.append(i)
             seen.add(i)
-    return [docs[i] for i in unique_indices]
-
-def filter_logs(docs, query):
-    query = query.lower()
-    filters = {}
-    
-    # Extract filters from query
-    date_match = re.search(r"\b(20\d{2}-\d{2}-\d{2})\b", query)
-    if date_match:
-        filters["RecordDate"] = date_match.group(1)
-    
-    for city in ["pune", "mumbai", "bangalore", "kalwa"]:
-        if city in query:
-            filters["LocationCode"] = city.upper()
-            break
-    
-    filtered = []
-    for doc in docs:
-        match = True
-        for k, v in filters.items():
-            if k == "LocationCode":
-                loc = doc.get("LocationCode", "").replace("LOC-IN-", "").upper()
-                if loc != v:
-                    match = False
-                    break
-            else:
-                if str(doc.get(k, "")).lower() != v.lower():
-                    match = False
-                    break
-        if match:
-            filtered.append(doc)
-    return filtered
-
-def doc_to_entry(d):
-    location = d.get("LocationCode", "").replace("LOC-IN-", "")
-    date = d.get("RecordDate", "unknown date")
-    time = d.get("Time", "")
-    hour = int(datetime.strptime(time, "%H:%M:%S").hour) if time else None
-    part = (
-        "morning" if 5 <= hour < 12 else
-        "afternoon" if 12 <= hour < 17 else
-        "evening" if 17 <= hour < 21 else
-        "night"
-    ) if hour is not None else ""
-    return (
-        f"On {d.get('DayOfWeek', '')}, {date} at {d.get('SiteDetails', '')} "
-        f"({d.get('Floor', '')}, {location}), WiFi count: {d.get('WiFiCount', 'N/A')}, "
-        f"Access count: {d.get('AccessControlCount', 'N/A')}, Type: {d.get('DayType', '')}, "
-        f"TimeSlot: {d.get('TimeSlot', '')}. Part of day: {part}."
-    )
+    return unique_indices
+
+def hybrid_search(query, qv, snapshot, top_k=RETRIEVAL_TOP_K, rows=None):
+    """Fuse dense (FAISS) and lexical (BM25) rankings with reciprocal rank fusion.
+
+    Both rank vector ids (one per distinct entry text); each result maps back
+    to one record row, so duplicate records never crowd out other evidence.
+    """
+    vids = snapshot.vectors.of_rows(rows) if rows is not None else None
+    dense = search_rag(qv, snapshot.index, top_k, vids, snapshot.binary)
+    lexical = snapshot.bm25.search(query, top_k, vids)
+    return snapshot.vectors.to_rows(reciprocal_rank_fusion([dense, lexical], limit=top_k), rows)
+
+def build_prompt(results, norm_q):
+    return f"""You are an expert log analyst. Use the following context to answer the question.
+
+Relevant entries:
+{chr(10).join(str(r) for r in results[:PROMPT_ENTRIES])}
+
+Question: {norm_q}
+Answer:"""
+
+async def encode_query(norm_q):
+    """Query vector, awaited on the event loop so concurrent requests share one encode batch."""
+    return await query_cache.encode_async(rag_model, norm_q) if rag_model else None
+
+def retrieve_rag(norm_q, qv):
+    """Return (prompt entries, total matches, source); only prompt rows are rendered.
+
+    Filters extracted from the question restrict the dense and BM25 searches to
+    matching rows ("hybrid"); with no filters, or none matching, the whole index
+    is searched.
+    """
+    snapshot = rag.current
+    filters = extract_filters(norm_q, FILTER_FIELDS)
+    rows = snapshot.log_index.lookup(filters) if filters else []
+    if not len(rows):
+        ranked = hybrid_search(norm_q, qv, snapshot)
+        return snapshot.entries.render(ranked), len(ranked), "vector"
+    ranked = hybrid_search(norm_q, qv, snapshot, PROMPT_ENTRIES, rows) or rows[:PROMPT_ENTRIES]
+    return snapshot.entries.render(ranked), len(rows), "hybrid"
+
+def retrieve_graph(norm_q):
+    snapshot = rag.current
+    rows = snapshot.log_index.lookup(extract_filters(norm_q, FILTER_FIELDS))
+    if not len(rows) and graph_retriever:
+        results = graph_retriever.get_relevant_documents(norm_q)
+        return [doc.page_content for doc in results], len(results), "vector"
+    return snapshot.entries.render(rows[:PROMPT_ENTRIES]), len(rows), "filter"
+
+def ndjson(event: dict) -> str:
+    return json.dumps(event, default=str) + "\n"
+
+async def stream_answer(norm_q, results, total, source, model_name, started):
+    """NDJSON event stream: metadata first, then one event per token, then timing stats.
+
+    Token events carry the text in a "response" field, the same shape Ollama
+    streams, so existing readers that concatenate `response` keep working.
+    """
+    retrieval_ms = (time.perf_counter() - started) * 1000
+    yield ndjson({
+        "type": "metadata",
+        "rewritten_query": norm_q,
+        "source": source,
+        "num_results": total,
+        "context": [str(r) for r in results[:PROMPT_ENTRIES]],
+        "model": model_name,
+    })
+    if not results:
+        yield ndjson({"type": "token", "response": "No relevant information found."})
+        yield ndjson({"type": "done", "stats": {"retrieval_ms": round(retrieval_ms, 1)}})
+        return
+
+    first_token_ms = None
+    final = {}
+    try:
+        async for chunk in ollama.stream_generate(build_prompt(results, norm_q), model_name):
+            token = chunk.get("response", "")
+            if token:
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - started) * 1000
+                yield ndjson({"type": "token", "response": token})
+            if chunk.get("done"):
+                final = chunk
+    except Exception as e:
+        yield ndjson({"type": "error", "error": f"Error streaming answer: {str(e)}"})
+
+    stats = {
+        "retrieval_ms": round(retrieval_ms, 1),
+        "time_to_first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None,
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    # Ollama reports durations in nanoseconds
+    for key in ("prompt_eval_count", "eval_count"):
+        if key in final:
+            stats[key] = final[key]
+    for key in ("load_duration", "prompt_eval_duration", "eval_duration"):
+        if key in final:
+            stats[key.replace("duration", "ms")] = round(final[key] / 1e6, 1)
+    yield ndjson({"type": "done", "stats": stats})
 
 # RAG Endpoint
 @app.post("/rag/query")
 async def ask_rag(request: QueryRequest):
     try:
-        norm_q = normalize_dates(request.question).lower()
-        filtered_docs = filter_logs(rag_docs, norm_q)
-        
-        if not filtered_docs:
-            results = search_rag(norm_q, rag_model, rag_index, rag_docs, top_k=10)
-        else:
-            results = [doc_to_entry(d) for d in filtered_docs]
+        norm_q = (await run_cpu(normalize_dates, request.question)).lower()
+        results, _, _ = await run_cpu(retrieve_rag, norm_q, await encode_query(norm_q))
         
         if not results:
             return {"answer": "No relevant information found."}
         
-        prompt = f"""You are an expert log analyst. Use the following context to answer the question.
-
-Relevant entries:
-{chr(10).join(str(r) for r in results[:5])}
-
-Question: {norm_q}
-Answer:"""
-        
         model_name = request.model or DEFAULT_OLLAMA_MODEL
-        answer = ask_ollama(prompt, model_name)
+        answer = await ask_ollama(build_prompt(results, norm_q), model_name)
         
         return {"answer": answer}
     except Exception as e:
         return {"answer": f"Error processing RAG query: {str(e)}"}
 
+@app.post("/rag/query/stream")
+async def ask_rag_stream(request: QueryRequest):
+    started = time.perf_counter()
+    try:
+        norm_q = (await run_cpu(normalize_dates, request.question)).lower()
+        results, total, source = await run_cpu(retrieve_rag, norm_q, await encode_query(norm_q))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing RAG query: {str(e)}")
+    model_name = request.model or DEFAULT_OLLAMA_MODEL
+    return StreamingResponse(
+        stream_answer(norm_q, results, total, source, model_name, started),
+        media_type="application/x-ndjson",
+    )
+
 # Graph Endpoint
 @app.post("/graph/query")
 async def ask_graph(request: QueryRequest):
     try:
-        norm_q = normalize_dates(request.question).lower()
-        filtered_docs = filter_logs(graph_docs, norm_q)
-        
-        if not filtered_docs and graph_retriever:
-            results = graph_retriever.get_relevant_documents(norm_q)
-            results = [doc.page_content for doc in results]
-        else:
-            results = [doc_to_entry(d) for d in filtered_docs]
+        norm_q = (await run_cpu(normalize_dates, request.question)).lower()
+        results, _, _ = await run_io(retrieve_graph, norm_q)
         
         if not results:
             return {"answer": "No relevant information found."}
         
-        prompt = f"""You are an expert log analyst. Use the following context to answer the question.
-
-Relevant entries:
-{chr(10).join(str(r) for r in results[:5])}
-
-Question: {norm_q}
-Answer:"""
-        
         model_name = request.model or DEFAULT_OLLAMA_MODEL
-        answer = ask_ollama(prompt, model_name)
+        answer = await ask_ollama(build_prompt(results, norm_q), model_name)
         
         return {"answer": answer}
     except Exception as e:
         return {"answer": f"Error processing Graph query: {str(e)}"}
 
+@app.post("/graph/query/stream")
+async def ask_graph_stream(request: QueryRequest):
+    started = time.perf_counter()
+    try:
+        norm_q = (await run_cpu(normalize_dates, request.question)).lower()
+        results, total, source = await run_io(retrieve_graph, norm_q)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing Graph query: {str(e)}")
+    model_name = request.model or DEFAULT_OLLAMA_MODEL
+    return StreamingResponse(
+        stream_answer(norm_q, results, total, source, model_name, started),
+        media_type="application/x-ndjson",
+    )
+
 # CrewAI Endpoint
 @app.post("/crewai/query")
 async def ask_crewai(query: CrewQuery):
     try:
-        result = run_crewai_query(query.query)
+        result = await run_io(run_crewai_query, query.query)
         return {"result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"CrewAI error: {str(e)}")
 
+@app.on_event("shutdown")
+async def close_llm_client():
+    await ollama.aclose()
+    executors.shutdown()
+
+# Query embedding cache stats, for sizing QUERY_CACHE_SIZE
+@app.get("/rag/cache/stats")
+async def rag_cache_stats():
+    return query_cache.stats()
+
+# RAG index build state and manual staleness check
+@app.get("/rag/index/status")
+async def rag_index_status():
+    return rag.status()
+
+@app.post("/rag/index/reload")
+async def rag_index_reload():
+    started = await run_io(rag.check)
+    return {"rebuild_started": started, **rag.status()}
+
+# Embedding micro-batching stats per loaded model
+@app.get("/embedding/stats")
+async def embedding_stats():
+    return loaded_models()
+
 # Health Check Endpoint
 @app.get("/health")
 async def health_check():
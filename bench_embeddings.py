@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Parity/throughput check for the embedding backends in embeddings.py.
+
+Encodes the entries of data.json and a set of generated questions with the
+fp32 torch model and with each other backend, then reports how closely the
+vectors agree (cosine to fp32) and the encoding throughput:
+    python bench_embeddings.py --backends int8 onnx --limit 2000
+
+Exits non-zero when a backend's mean cosine falls below --min-cosine, so it
+can gate switching EMBED_BACKEND for a deployment.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from bench_index import make_questions
+from embeddings import EMBED_BACKENDS, load_model
+from ingest import iter_records
+from records import doc_to_entry
+
+
+def encode_timed(model, texts, batch_size):
+    model.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+    start = time.perf_counter()
+    vectors = model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+    seconds = time.perf_counter() - start
+    return np.asarray(vectors, dtype=np.float32), len(texts) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends against the fp32 model")
+    parser.add_argument("--data", default="data.json")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backends", nargs="+", default=["int8"], choices=EMBED_BACKENDS)
+    parser.add_argument("--onnx-file", default=None, help="ONNX graph in the model folder, e.g. onnx/model_qint8_avx512_vnni.onnx")
+    parser.add_argument("--limit", type=int, default=2000, help="entries encoded (0 = all)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    records = list(iter_records(args.data))
+    if args.limit:
+        records = records[:args.limit]
+    texts = [doc_to_entry(d) for d in records] + make_questions(records, args.queries, args.seed)
+    print(f"{len(texts)} texts ({len(texts) - args.queries} entries, {args.queries} questions)\n")
+
+    baseline, baseline_rate = encode_timed(load_model(args.model, "torch"), texts, args.batch_size)
+    print(f"{'backend':<10}{'sent/s':>10}{'speedup':>10}{'mean cos':>10}{'min cos':>10}{'p1 cos':>10}")
+    print(f"{'torch':<10}{baseline_rate:>10.1f}{1.0:>10.2f}{1.0:>10.4f}{1.0:>10.4f}{1.0:>10.4f}")
+
+    failed = []
+    for backend in args.backends:
+        if backend == "torch":
+            continue
+        vectors, rate = encode_timed(load_model(args.model, backend, args.onnx_file), texts, args.batch_size)
+        cosine = np.einsum("ij,ij->i", vectors, baseline)
+        print(f"{backend:<10}{rate:>10.1f}{rate / baseline_rate:>10.2f}{cosine.mean():>10.4f}"
+              f"{cosine.min():>10.4f}{np.percentile(cosine, 1):>10.4f}")
+        if cosine.mean() < args.min_cosine:
+            failed.append(backend)
+
+    if failed:
+        print(f"\nBelow --min-cosine {args.min_cosine}: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
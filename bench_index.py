@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Recall/latency/memory benchmark for the RAG index types in index_types.py.
+
+Encodes the entries of data.json (or reads vectors back from a flat
+vector.index), builds every index type, and compares each against the exact
+flat baseline on the same queries:
+    python bench_index.py --types flat ivf_flat ivf_pq hnsw sq8 fp16 --queries 200
+
+--pca adds PCA-reduced variants of each type, e.g. --pca 0 192 128 (0 = full dimension).
+--binary adds the two-stage binary prefilter with the given re-rank candidate
+counts, e.g. --binary 100 200 400; its memory column is the binary codes only.
+"""
+
+import argparse
+import random
+import time
+
+import faiss
+import numpy as np
+
+from binary_index import BinaryPrefilter
+from index_types import INDEX_TYPES, create_index, index_memory_bytes
+from ingest import iter_records
+from records import doc_to_entry
+
+QUESTION_TEMPLATES = [
+    "wifi count at {SiteDetails} {Floor} in {city} on {RecordDate}",
+    "how busy was {city} {SiteDetails} on {DayOfWeek} around {Time}",
+    "access count for {Floor} of {SiteDetails} during {TimeSlot}",
+    "{DayType} occupancy in {city} on {RecordDate}",
+]
+
+
+def make_questions(records, count, seed):
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(count):
+        d = dict(rng.choice(records))
+        d["city"] = d.get("LocationCode", "").replace("LOC-IN-", "").title()
+        questions.append(rng.choice(QUESTION_TEMPLATES).format_map(d))
+    return questions
+
+
+def load_vectors(args):
+    if args.from_index:
+        index = faiss.read_index(args.from_index)
+        corpus = index.reconstruct_n(0, index.ntotal)
+        # Without the model, query with slightly perturbed corpus vectors
+        rng = np.random.default_rng(args.seed)
+        picks = corpus[rng.choice(len(corpus), min(args.queries, len(corpus)), replace=False)]
+        queries = picks + rng.normal(scale=0.05, size=picks.shape).astype(np.float32)
+        faiss.normalize_L2(queries)
+        return corpus, queries
+    from embeddings import get_model
+    model = get_model(args.model)
+    records = list(iter_records(args.data))
+    corpus = model.encode([doc_to_entry(d) for d in records], normalize_embeddings=True)
+    queries = model.encode(make_questions(records, args.queries, args.seed), normalize_embeddings=True)
+    return np.asarray(corpus, dtype=np.float32), np.asarray(queries, dtype=np.float32)
+
+
+def timed_search(index, queries, k):
+    latencies = []
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    for i, q in enumerate(queries):
+        start = time.perf_counter()
+        _, I = index.search(q.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids[i] = I[0]
+    return ids, np.asarray(latencies)
+
+
+def recall_at_k(approx, exact):
+    hits = 0
+    total = 0
+    for a, e in zip(approx, exact):
+        truth = set(e[e >= 0].tolist())
+        hits += len(truth & set(a[a >= 0].tolist()))
+        total += len(truth)
+    return hits / total if total else 0.0
+
+
+def bench_one(kind, pca_dim, corpus, queries, exact, k):
+    start = time.perf_counter()
+    index, info = create_index(kind, corpus, pca_dim=pca_dim)
+    build_s = time.perf_counter() - start
+    ids, latencies = timed_search(index, queries, k)
+    print(
+        f"{kind:<10}{info['factory']:<34}{recall_at_k(ids, exact):>10.3f}"
+        f"{np.percentile(latencies, 50):>10.3f}{np.percentile(latencies, 99):>10.3f}"
+        f"{index_memory_bytes(index) / 1e6:>12.2f}{build_s:>10.2f}"
+        + (f"  {info['search_params']}" if info["search_params"] else "")
+    )
+
+
+def bench_binary(prefilter, index, candidates, queries, exact, k, build_s):
+    latencies = []
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for i, q in enumerate(queries):
+        start = time.perf_counter()
+        found = prefilter.search(index, q, k, candidates)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids[i, :len(found)] = found
+    print(
+        f"{'binary':<10}{f'BFlat+rerank{candidates}':<34}{recall_at_k(ids, exact):>10.3f}"
+        f"{np.percentile(latencies, 50):>10.3f}{np.percentile(latencies, 99):>10.3f}"
+        f"{prefilter.index.ntotal * prefilter.index.code_size / 1e6:>12.2f}{build_s:>10.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG index types against the flat baseline")
+    parser.add_argument("--data", default="data.json")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--from-index", default=None, help="reuse vectors stored in a flat index instead of encoding")
+    parser.add_argument("--types", nargs="+", default=INDEX_TYPES, choices=INDEX_TYPES)
+    parser.add_argument("--pca", nargs="+", type=int, default=[0], help="PCA dimensions to try (0 = none)")
+    parser.add_argument("--binary", nargs="*", type=int, default=[], help="binary prefilter candidate counts to try")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    corpus, queries = load_vectors(args)
+    k = min(args.k, len(corpus))
+    print(f"Corpus: {len(corpus)} vectors x {corpus.shape[1]} dims, {len(queries)} queries, k={k}\n")
+
+    baseline, _ = create_index("flat", corpus, pca_dim=0)
+    _, exact = baseline.search(queries, k)
+
+    print(f"{'type':<10}{'factory':<34}{'recall@' + str(k):>10}{'p50 ms':>10}{'p99 ms':>10}{'memory MB':>12}{'build s':>10}")
+    for pca_dim in args.pca:
+        for kind in args.types:
+            bench_one(kind, pca_dim, corpus, queries, exact, k)
+    if args.binary:
+        start = time.perf_counter()
+        prefilter = BinaryPrefilter.build(baseline)
+        build_s = time.perf_counter() - start
+        for candidates in args.binary:
+            bench_binary(prefilter, baseline, candidates, queries, exact, k, build_s)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+
+import faiss
+import numpy as np
+
+# -------- CONFIG --------
+# Two-stage dense search: a Hamming scan over sign bits, then exact re-ranking of the candidates
+RAG_BINARY_PREFILTER = os.getenv("RAG_BINARY_PREFILTER", "0") == "1"
+RAG_BINARY_CANDIDATES = int(os.getenv("RAG_BINARY_CANDIDATES", "200"))  # candidates re-ranked per query
+
+# Index types whose vectors can be read back for re-ranking without a direct map
+RERANK_TYPES = ("flat", "hnsw", "sq8", "fp16")
+_BUILD_CHUNK = 65536  # vectors read back from the index per step
+
+
+def binarize(vectors):
+    """One bit per dimension, set where the component is positive; 32x smaller than float32."""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+
+class BinaryPrefilter:
+    """Sign-binarized copy of the vectors in a RAG index, for a Hamming-distance first stage.
+
+    Queries scan the packed codes (dim/8 bytes per vector) for the closest
+    candidates by Hamming distance, then re-score only those with the exact
+    inner product against vectors read back from the main index. With a flat
+    index mapped from disk, only the candidates' pages are touched.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return self.index.ntotal
+
+    @classmethod
+    def build(cls, index):
+        return cls(faiss.IndexBinaryFlat(index.d)).extended(index)
+
+    def extended(self, index):
+        """A copy that also covers vectors appended to `index` since this one was built."""
+        binary = faiss.clone_binary_index(self.index)
+        for start in range(binary.ntotal, index.ntotal, _BUILD_CHUNK):
+            binary.add(binarize(index.reconstruct_n(start, min(_BUILD_CHUNK, index.ntotal - start))))
+        return BinaryPrefilter(binary)
+
+    def search(self, index, query_vector, k, candidates=RAG_BINARY_CANDIDATES):
+        """Top-k vector ids of `index` by inner product, scoring only the Hamming candidates."""
+        k = min(k, self.index.ntotal)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        query = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        _, I = self.index.search(binarize(query), min(max(candidates, k), self.index.ntotal))
+        ids = I[0][I[0] >= 0]
+        scores = index.reconstruct_batch(ids) @ query[0]
+        return ids[np.argsort(-scores, kind="stable")[:k]]
+
+    def save(self, path):
+        faiss.write_index_binary(self.index, path)
+
+    @classmethod
+    def load(cls, path):
+        return cls(faiss.read_index_binary(path))
+
+
+def check_rerank_type(index_type, pca_dim=0):
+    if index_type not in RERANK_TYPES or pca_dim:
+        raise ValueError(f"RAG_BINARY_PREFILTER re-ranks with full vectors from the index: use RAG_INDEX_TYPE "
+                         f"{', '.join(RERANK_TYPES)} without RAG_PCA_DIM, not {index_type!r} (pca_dim={pca_dim})")
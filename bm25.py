@@ -0,0 +1,135 @@
+import re
+from collections import Counter
+
+import numpy as np
+
+# Keep times ("07:15", "12:45:00") and dates whole so TimeSlot and RecordDate
+# strings match exactly; everything else splits into lower-case words/numbers
+TOKEN_RE = re.compile(r"\d{4}-\d{2}-\d{2}|\d{1,2}:\d{2}(?::\d{2})?|[a-z0-9]+")
+
+RRF_K = 60
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Compact Okapi BM25 index over entry texts, stored as CSR posting arrays.
+
+    For term id t, postings live in doc_ids/tfs[offsets[t]:offsets[t + 1]].
+    Row ids are the same as the FAISS index and doc store.
+    """
+
+    def __init__(self, vocab, offsets, doc_ids, tfs, doc_lens, k1=1.2, b=0.75):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+        n = len(doc_lens)
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(doc_lens.mean()) if n else 1.0
+        # Per-document length normalization term, precomputed once
+        self.norm = (k1 * (1 - b + b * doc_lens / max(avgdl, 1e-9))).astype(np.float32)
+
+    def __len__(self):
+        return len(self.doc_lens)
+
+    @classmethod
+    def build(cls, texts):
+        postings = {}
+        doc_lens = np.zeros(len(texts), dtype=np.int32)
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lens[row] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((row, tf))
+        terms = sorted(postings)
+        vocab = {term: i for i, term in enumerate(terms)}
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings[term])
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        for i, term in enumerate(terms):
+            rows, counts = zip(*postings[term])
+            doc_ids[offsets[i]:offsets[i + 1]] = rows
+            tfs[offsets[i]:offsets[i + 1]] = np.minimum(counts, np.iinfo(np.uint16).max)
+        return cls(vocab, offsets, doc_ids, tfs, doc_lens)
+
+    def extended(self, texts):
+        """A new index with `texts` appended as the next rows; only the new texts are tokenized."""
+        return BM25Index.concat([self, BM25Index.build(texts)])
+
+    @classmethod
+    def concat(cls, parts):
+        """One index over the rows of `parts` (at least one) in order, merging their posting arrays.
+
+        The parts are left untouched, so a live index can be one of them.
+        """
+        terms = sorted(set().union(*(part.vocab for part in parts)))
+        vocab = {term: i for i, term in enumerate(terms)}
+        term_of, doc_ids, tfs, base = [], [], [], 0
+        for part in parts:
+            ids = np.array([vocab[t] for t in sorted(part.vocab, key=part.vocab.get)], dtype=np.int64)
+            term_of.append(np.repeat(ids, np.diff(part.offsets)))
+            doc_ids.append(part.doc_ids + np.int32(base))
+            tfs.append(part.tfs)
+            base += len(part)
+        term_of = np.concatenate(term_of)
+        # Stable, so within a term each part's postings follow the earlier parts' (lower row ids)
+        order = np.argsort(term_of, kind="stable")
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_of, minlength=len(terms)), out=offsets[1:])
+        doc_lens = np.concatenate([part.doc_lens for part in parts])
+        return cls(vocab, offsets, np.concatenate(doc_ids)[order], np.concatenate(tfs)[order], doc_lens,
+                   parts[0].k1, parts[0].b)
+
+    def search(self, query, k, rows=None):
+        """Row ids of the k best-scoring documents (score > 0), optionally only within `rows`."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            ids = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            scores[ids] += self.idf[t] * tf * (self.k1 + 1) / (tf + self.norm[ids])
+        if rows is not None:
+            candidates = np.asarray(rows, dtype=np.int64)
+            candidates = candidates[scores[candidates] > 0]
+        else:
+            candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            top = np.argpartition(-scores[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    def save(self, path):
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(path, "wb") as f:
+            np.savez(f, terms=np.array(terms, dtype=str), offsets=self.offsets, doc_ids=self.doc_ids,
+                     tfs=self.tfs, doc_lens=self.doc_lens, params=np.array([self.k1, self.b]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            vocab = {term: i for i, term in enumerate(data["terms"].tolist())}
+            k1, b = data["params"].tolist()
+            return cls(vocab, data["offsets"], data["doc_ids"], data["tfs"], data["doc_lens"], k1, b)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K, limit=None):
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in."""
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            row = int(row)
+            scores[row] = scores.get(row, 0.0) + 1.0 / (k + rank + 1)
+    fused = sorted(scores, key=lambda row: (-scores[row], row))
+    return fused[:limit] if limit is not None else fused
@@ -0,0 +1,326 @@
+import os
+import sys
+import json
+import shutil
+import time
+
+import numpy as np
+
+# Per-row state of a field, kept in each column's mask array
+ABSENT, NULL, PRESENT = 0, 1, 2
+
+CURRENT_FILE = "CURRENT"
+META_FILE = "meta.json"
+# Replaced versions are kept this long, so processes that read CURRENT just
+# before a switch can still open the version it named
+_KEEP_REPLACED_S = 3600
+
+
+def _infer_kind(values):
+    """"int" or "float" when every value has that exact type, else "category".
+
+    Mixed int/float columns stay categorical so 2 does not come back as 2.0.
+    """
+    kinds = {type(v) for v in values}
+    if kinds == {int} and all(-2 ** 63 <= v < 2 ** 63 for v in values):
+        return "int"
+    if kinds == {float}:
+        return "float"
+    return "category"
+
+
+def _code_dtype(cardinality):
+    # Smallest signed type that still leaves -1 for "not present"
+    if cardinality <= np.iinfo(np.int8).max:
+        return np.int8
+    if cardinality <= np.iinfo(np.int16).max:
+        return np.int16
+    return np.int32
+
+
+def _encode_column(name, values, mask, category=False):
+    """Arrays and metadata for one field; `values` holds None where mask is not PRESENT."""
+    present = [v for v, m in zip(values, mask) if m == PRESENT]
+    kind = "category" if category else _infer_kind(present)
+    meta = {"name": name, "kind": kind}
+    if kind == "int":
+        data = np.array([v if m == PRESENT else 0 for v, m in zip(values, mask)], dtype=np.int64)
+    elif kind == "float":
+        data = np.array([v if m == PRESENT else np.nan for v, m in zip(values, mask)], dtype=np.float64)
+    else:
+        # Dictionary-encode: codes index into the JSON `values` list stored in meta.json
+        codes, lookup = [], {}
+        meta["values"] = []
+        for v, m in zip(values, mask):
+            if m != PRESENT:
+                codes.append(-1)
+                continue
+            key = json.dumps(v, sort_keys=True)
+            if key not in lookup:
+                lookup[key] = len(meta["values"])
+                meta["values"].append(sys.intern(v) if isinstance(v, str) else v)
+            codes.append(lookup[key])
+        data = np.array(codes, dtype=_code_dtype(len(meta["values"])))
+    return meta, data, np.asarray(mask, dtype=np.uint8)
+
+
+def encode_records(records):
+    """Column-encode an iterable of record dicts: (num_rows, field metas, data arrays, masks)."""
+    names, columns, masks = [], {}, {}
+    count = 0
+    for row, record in enumerate(records):
+        for name, value in record.items():
+            if name not in columns:
+                names.append(name)
+                columns[name] = [None] * row
+                masks[name] = [ABSENT] * row
+            columns[name].append(value)
+            masks[name].append(NULL if value is None else PRESENT)
+        count = row + 1
+        for name in names:
+            if len(masks[name]) < count:
+                columns[name].append(None)
+                masks[name].append(ABSENT)
+    fields, data, mask = [], [], []
+    for name in names:
+        meta, values, states = _encode_column(name, columns.pop(name), masks.pop(name))
+        fields.append(meta)
+        data.append(values)
+        mask.append(states)
+    return count, fields, data, mask
+
+
+def _absent_column(kind, rows):
+    if kind == "int":
+        return np.zeros(rows, dtype=np.int64)
+    if kind == "float":
+        return np.full(rows, np.nan, dtype=np.float64)
+    return np.full(rows, -1, dtype=np.int32)
+
+
+def _merge_column(name, parts):
+    """(field meta, data, mask) of one field over consecutive column chunks.
+
+    `parts` holds (field meta or None, data, mask, num_rows) per chunk. The
+    kind is the one a single encode of all rows would infer: chunks without
+    present values take any kind, and differing kinds make it categorical.
+    Category codes are remapped onto one dictionary in first-seen order.
+    """
+    kinds = {field["kind"] for field, _, _, _ in parts
+             if field is not None and (field["kind"] != "category" or field["values"])}
+    kind = kinds.pop() if len(kinds) == 1 else "category"
+    masks = [mask if field is not None else np.full(rows, ABSENT, dtype=np.uint8)
+             for field, _, mask, rows in parts]
+    meta = {"name": name, "kind": kind}
+    if kind != "category":
+        data = [np.asarray(data) if field is not None and field["kind"] == kind else _absent_column(kind, rows)
+                for field, data, _, rows in parts]
+        return meta, np.concatenate(data), np.concatenate(masks)
+    meta["values"], lookup, codes = [], {}, []
+    for field, data, mask, rows in parts:
+        if field is None:
+            codes.append(_absent_column("category", rows))
+            continue
+        if field["kind"] != "category":
+            # Numbers from a chunk that must now share a dictionary with other kinds
+            values = np.asarray(data).tolist()
+            field, data, _ = _encode_column(name, [v if m == PRESENT else None for v, m in zip(values, mask)],
+                                            mask, category=True)
+        remap = np.empty(len(field["values"]) + 1, dtype=np.int32)
+        remap[-1] = -1  # code -1 (not present) indexes the last slot
+        for code, v in enumerate(field["values"]):
+            key = json.dumps(v, sort_keys=True)
+            if key not in lookup:
+                lookup[key] = len(meta["values"])
+                meta["values"].append(v)
+            remap[code] = lookup[key]
+        codes.append(remap[np.asarray(data)])
+    return meta, np.concatenate(codes).astype(_code_dtype(len(meta["values"]))), np.concatenate(masks)
+
+
+class DocStoreWriter:
+    """Writes a new doc store version from record batches, after the rows of `base` when given.
+
+    Each add() column-encodes one batch, so only compact arrays are kept
+    while the records stream past; finish() merges them with the base
+    columns (copied as arrays, never decoded into dicts) and writes the
+    version directory, and publish() switches CURRENT to it. Readers keep
+    seeing the previous version until then.
+    """
+
+    def __init__(self, path, base=None):
+        self.path = path
+        self.chunks = []
+        if base is not None and len(base):
+            self.chunks.append((base.num_rows, base.fields, base.data, base.masks))
+        self.num_rows = sum(chunk[0] for chunk in self.chunks)
+        self.version = None
+
+    def add(self, records):
+        count, fields, data, masks = encode_records(records)
+        if count:
+            self.chunks.append((count, fields, data, masks))
+            self.num_rows += count
+
+    def finish(self):
+        """Write the version directory; returns it opened as a DocStore."""
+        names = []
+        for _, fields, _, _ in self.chunks:
+            names.extend(field["name"] for field in fields if field["name"] not in names)
+        positions = [{field["name"]: i for i, field in enumerate(fields)} for _, fields, _, _ in self.chunks]
+        os.makedirs(self.path, exist_ok=True)
+        self.version = f"v{time.time_ns():x}-{os.getpid()}"
+        version_dir = os.path.join(self.path, self.version)
+        os.makedirs(version_dir)
+        metas = []
+        for i, name in enumerate(names):
+            parts = []
+            for (rows, fields, data, masks), columns in zip(self.chunks, positions):
+                j = columns.get(name)
+                parts.append((fields[j], data[j], masks[j], rows) if j is not None else (None, None, None, rows))
+            meta, data, mask = _merge_column(name, parts)
+            np.save(os.path.join(version_dir, f"{i}.data.npy"), data)
+            np.save(os.path.join(version_dir, f"{i}.mask.npy"), mask)
+            metas.append(meta)
+        with open(os.path.join(version_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"num_rows": self.num_rows, "fields": metas}, f)
+        self.chunks = []
+        return DocStore.open_version(version_dir)
+
+    def publish(self):
+        """Switch CURRENT to the written version, then drop versions replaced long enough ago.
+
+        Returns the number of rows.
+        """
+        if self.version is None:
+            self.finish()
+        current = os.path.join(self.path, CURRENT_FILE)
+        previous = None
+        if os.path.exists(current):
+            with open(current, "r", encoding="utf-8") as f:
+                previous = f.read().strip()
+        tmp = os.path.join(self.path, f"{CURRENT_FILE}.tmp-{os.getpid()}")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.version)
+        os.replace(tmp, current)
+        cutoff = time.time() - _KEEP_REPLACED_S
+        for entry in os.listdir(self.path):
+            if not entry.startswith("v") or entry == self.version:
+                continue
+            full = os.path.join(self.path, entry)
+            if entry == previous:
+                os.utime(full)  # replaced just now: the grace period starts here
+            elif os.path.getmtime(full) < cutoff:
+                shutil.rmtree(full, ignore_errors=True)
+        return self.num_rows
+
+
+class DocStore:
+    """Read-only columnar records: the one dataset object a process keeps.
+
+    Categorical fields are small integer codes into interned value lists,
+    counts are typed arrays, and a mask per field marks absent/null values.
+    Opened from disk the columns are memory-mapped, so worker processes share
+    the pages; from_records builds the same layout in memory. Rows are
+    addressed by the same ids as the FAISS index, and indexing, iterating or
+    take() yields plain dicts built on demand from the columns.
+    """
+
+    def __init__(self, num_rows, fields, data, masks):
+        self.num_rows = num_rows
+        self.fields = fields
+        self.data = data
+        self.masks = masks
+        self._columns = {field["name"]: i for i, field in enumerate(fields)}
+
+    @classmethod
+    def from_records(cls, records):
+        return cls(*encode_records(records))
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return cls.open_version(os.path.join(path, f.read().strip()))
+
+    @classmethod
+    def open_version(cls, version_dir):
+        with open(os.path.join(version_dir, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        data, masks = [], []
+        for i in range(len(meta["fields"])):
+            data.append(np.load(os.path.join(version_dir, f"{i}.data.npy"), mmap_mode="r"))
+            masks.append(np.load(os.path.join(version_dir, f"{i}.mask.npy"), mmap_mode="r"))
+        for field in meta["fields"]:
+            if "values" in field:
+                field["values"] = [sys.intern(v) if isinstance(v, str) else v for v in field["values"]]
+        return cls(meta["num_rows"], meta["fields"], data, masks)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, CURRENT_FILE))
+
+    def __len__(self):
+        return self.num_rows
+
+    def factorize(self, name, default=None):
+        """(codes, values) for one field over all rows, with values[codes[row]] its value.
+
+        Absent fields map to `default` and nulls to None, mirroring record.get(name, default).
+        """
+        i = self._columns.get(name)
+        if i is None:
+            return np.zeros(self.num_rows, dtype=np.int32), [default]
+        if self.fields[i]["kind"] == "category":
+            values = list(self.fields[i]["values"])
+            codes = np.asarray(self.data[i], dtype=np.int32)
+        else:
+            uniques, codes = np.unique(np.asarray(self.data[i]), return_inverse=True)
+            values = uniques.tolist()
+            codes = codes.astype(np.int32)
+        mask = np.asarray(self.masks[i])
+        codes = np.where(mask == PRESENT, codes, np.where(mask == NULL, len(values), len(values) + 1))
+        return codes, values + [None, default]
+
+    def _decode(self, i, rows):
+        field = self.fields[i]
+        values = self.data[i][rows].tolist()
+        if field["kind"] == "category":
+            lookup = field["values"]
+            values = [lookup[c] if c >= 0 else None for c in values]
+        return values
+
+    def _dicts(self, rows, count):
+        """Dicts for `rows` (a slice or an array of row ids), decoded a column at a time."""
+        out = [{} for _ in range(count)]
+        for i, field in enumerate(self.fields):
+            name = field["name"]
+            mask = self.masks[i][rows]
+            for d, value, state in zip(out, self._decode(i, rows), mask.tolist()):
+                if state == PRESENT:
+                    d[name] = value
+                elif state == NULL:
+                    d[name] = None
+        return out
+
+    def records(self, start=0, stop=None):
+        """Dicts for rows start..stop-1."""
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        if start >= stop:
+            return []
+        return self._dicts(slice(start, stop), stop - start)
+
+    def take(self, rows):
+        """Dicts for the given row ids, in that order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return self._dicts(rows, len(rows)) if len(rows) else []
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += self.num_rows
+        if not 0 <= row < self.num_rows:
+            raise IndexError(row)
+        return self.records(row, row + 1)[0]
+
+    def __iter__(self, batch=10000):
+        for start in range(0, self.num_rows, batch):
+            yield from self.records(start, start + batch)
@@ -0,0 +1,102 @@
+import os
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+
+from embeddings import model_id
+
+# -------- CONFIG --------
+# SQLite file of document embeddings keyed by hash(model id, text); empty disables the cache
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embedding_cache.sqlite")
+# Vectors are stored as float16; values are rounded the same way whether they were
+# just encoded or read back, so a build gives the same index either way
+EMBED_CACHE_DTYPE = np.float16
+_LOOKUP_BATCH = 500  # keys per SELECT, under SQLite's bound-parameter limit
+
+
+def _row_id(key):
+    return int.from_bytes(key[:8], "little", signed=True)
+
+
+class EmbeddingCache:
+    """Persistent, content-addressed cache of raw (unnormalized) document embeddings.
+
+    Rows are keyed by a hash of the model id (name plus inference backend) and
+    the exact text, so entries never go stale: a changed text, template or
+    model simply misses. Index rebuilds after config changes then only encode
+    texts never seen before. Safe to share between threads and processes; the
+    connection is opened lazily per process.
+    """
+
+    def __init__(self, path, model):
+        self.path = path
+        self.model = model
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Rows are found by the first 8 bytes of the key (the rowid); the full key
+            # is stored to tell the rare colliding texts apart
+            conn.execute("CREATE TABLE IF NOT EXISTS vectors (id INTEGER PRIMARY KEY, key BLOB NOT NULL, vector BLOB NOT NULL)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def key(self, text):
+        return hashlib.blake2b(f"{self.model}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+    def _lookup(self, keys):
+        found = {}
+        ids = list({_row_id(key) for key in keys})
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(ids), _LOOKUP_BATCH):
+                batch = ids[start:start + _LOOKUP_BATCH]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM vectors WHERE id IN ({','.join('?' * len(batch))})", batch
+                )
+                found.update((key, np.frombuffer(blob, dtype=EMBED_CACHE_DTYPE)) for key, blob in rows)
+        return found
+
+    def encode(self, texts, encode):
+        """Vectors for `texts` (float32, one row each), calling `encode(list)` only for cache misses."""
+        texts = list(texts)
+        keys = [self.key(t) for t in texts]
+        found = self._lookup(keys)
+        todo = [i for i, key in enumerate(keys) if key not in found]
+        if todo:
+            fresh = np.asarray(encode([texts[i] for i in todo]), dtype=np.float32).astype(EMBED_CACHE_DTYPE)
+            rows = [(_row_id(keys[i]), keys[i], vector.tobytes()) for i, vector in zip(todo, fresh)]
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.executemany("INSERT OR IGNORE INTO vectors (id, key, vector) VALUES (?, ?, ?)", rows)
+            found.update((keys[i], vector) for i, vector in zip(todo, fresh))
+        self.hits += len(texts) - len(todo)
+        self.misses += len(todo)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys]).astype(np.float32)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "model": self.model,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def open_cache(model_name, path=EMBED_CACHE_PATH):
+    """The cache for vectors of `model_name` on the configured backend, or None when disabled."""
+    return EmbeddingCache(path, model_id(model_name)) if path else None
@@ -0,0 +1,286 @@
+import os
+import asyncio
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sentence_transformers import SentenceTransformer
+
+# -------- CONFIG --------
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+# Concurrent encode calls are merged until this many sentences are queued
+# or the oldest has waited this long, whichever comes first
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+# Inference backend: "torch" (fp32), "int8" (torch dynamic int8 quantization of the
+# Linear layers, CPU) or "onnx" (ONNX Runtime; needs sentence-transformers>=3.2 and
+# optimum[onnxruntime])
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+# ONNX graph inside the model folder, e.g. "onnx/model_qint8_avx512_vnni.onnx"; default onnx/model.onnx
+EMBED_ONNX_FILE = os.getenv("EMBED_ONNX_FILE")
+EMBED_BACKENDS = ["torch", "int8", "onnx"]
+
+
+def normalize_query(text):
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of query embeddings keyed by normalized query text.
+
+    Thread-safe, since encodes run on the executor pools. The normalized text is
+    what gets encoded, so every variant that maps to a key shares one vector.
+    """
+
+    def __init__(self, maxsize=QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def encode(self, model, query):
+        key = normalize_query(query)
+        vector = self._get(key)
+        if vector is None:
+            vector = self._put(key, model.encode([key], normalize_embeddings=True)[0])
+        return vector
+
+    async def encode_async(self, model, query):
+        """Like encode, awaiting the model's batcher instead of blocking a thread on it."""
+        key = normalize_query(query)
+        vector = self._get(key)
+        if vector is None:
+            vector = self._put(key, (await model.encode_async([key], normalize_embeddings=True))[0])
+        return vector
+
+    def _get(self, key):
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return vector
+
+    def _put(self, key, vector):
+        vector.setflags(write=False)
+        if self.maxsize <= 0:
+            return vector
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.maxsize:
+                self._vectors.popitem(last=False)
+                self.evictions += 1
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._vectors.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._vectors),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class BatchingEncoder:
+    """Micro-batches concurrent `encode` calls onto one SentenceTransformer.
+
+    Callers on any thread get the same interface as `SentenceTransformer.encode`
+    for list input. A single worker thread drains the queue, groups pending
+    sentences that share encode options, runs one batched `encode` per group and
+    fans the rows back out to each caller. Large calls (index builds) bypass the
+    queue and go straight to the model. Request handlers use `encode_async`,
+    which waits on the event loop rather than on a pool thread, so any number
+    of in-flight requests can share a batch.
+    """
+
+    def __init__(self, model, max_batch=EMBED_BATCH_MAX, max_wait_ms=EMBED_BATCH_WAIT_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.sentences = 0
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, sentences, **kwargs):
+        if isinstance(sentences, str):
+            return self.encode([sentences], **kwargs)[0]
+        if not sentences:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        if len(sentences) >= self.max_batch:
+            return self.model.encode(sentences, **kwargs)
+        return self._submit(sentences, kwargs).result()
+
+    async def encode_async(self, sentences, **kwargs):
+        """`encode` for coroutines: queues the sentences and awaits their rows."""
+        if not sentences:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        return await asyncio.wrap_future(self._submit(sentences, kwargs))
+
+    def _submit(self, sentences, kwargs):
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((list(sentences), kwargs, future))
+        return future
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        pending = [self._queue.get()]
+        count = len(pending[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(item)
+            count += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            groups = {}
+            for item in pending:
+                key = tuple(sorted(item[1].items()))
+                groups.setdefault(key, []).append(item)
+            for items in groups.values():
+                texts = [text for sentences, _, _ in items for text in sentences]
+                try:
+                    vectors = np.asarray(self.model.encode(texts, batch_size=len(texts), **items[0][1]))
+                except Exception as e:
+                    for _, _, future in items:
+                        future.set_exception(e)
+                    continue
+                self.batches += 1
+                self.sentences += len(texts)
+                offset = 0
+                for sentences, _, future in items:
+                    future.set_result(vectors[offset:offset + len(sentences)])
+                    offset += len(sentences)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "sentences": self.sentences,
+            "avg_batch_size": round(self.sentences / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+class BatchedEmbeddings(Embeddings):
+    """LangChain embeddings backed by a BatchingEncoder, for Neo4jVector.
+
+    Mirrors HuggingFaceEmbeddings' defaults (no normalization) so vectors match
+    those already stored in Neo4j. With an EmbeddingCache, documents seen in an
+    earlier run are not encoded again; queries always go to the model.
+    """
+
+    def __init__(self, encoder, normalize_embeddings=False, cache=None):
+        self.encoder = encoder
+        self.normalize_embeddings = normalize_embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        texts = [t.replace("\n", " ") for t in texts]
+        if self.cache is None:
+            vectors = self.encoder.encode(texts, normalize_embeddings=self.normalize_embeddings)
+            return [v.tolist() for v in vectors]
+        vectors = self.cache.encode(texts, self.encoder.encode)
+        if self.normalize_embeddings and len(vectors):
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return [v.tolist() for v in vectors]
+
+    def embed_query(self, text):
+        text = text.replace("\n", " ")
+        return self.encoder.encode([text], normalize_embeddings=self.normalize_embeddings)[0].tolist()
+
+
+def model_id(name, backend=EMBED_BACKEND, onnx_file=EMBED_ONNX_FILE):
+    """Identity of the vectors a model produces; recorded with indexes built from them."""
+    name = os.path.normpath(name)  # so "./all-MiniLM-L6-v2" and "all-MiniLM-L6-v2" agree
+    if backend == "torch":
+        return name
+    if backend == "onnx" and onnx_file:
+        return f"{name}@onnx:{onnx_file}"
+    return f"{name}@{backend}"
+
+
+def load_model(name, backend=EMBED_BACKEND, onnx_file=EMBED_ONNX_FILE):
+    """Load a SentenceTransformer running on the given inference backend."""
+    if backend == "torch":
+        return SentenceTransformer(name)
+    if backend == "int8":
+        import torch
+
+        model = SentenceTransformer(name, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    if backend == "onnx":
+        model_kwargs = {"file_name": onnx_file} if onnx_file else None
+        try:
+            return SentenceTransformer(name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+        except TypeError as e:
+            raise RuntimeError("EMBED_BACKEND=onnx needs sentence-transformers>=3.2") from e
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBED_BACKENDS}")
+
+
+# -------- MODEL REGISTRY --------
+# One SentenceTransformer (on EMBED_BACKEND) and one batcher per model name per
+# process, shared by the FAISS code, the LangChain wrappers and the index builders.
+_models = {}
+_encoders = {}
+_registry_lock = threading.Lock()
+
+
+def get_model(name):
+    with _registry_lock:
+        if name not in _models:
+            _models[name] = load_model(name)
+        return _models[name]
+
+
+def get_encoder(name):
+    model = get_model(name)
+    with _registry_lock:
+        if name not in _encoders:
+            _encoders[name] = BatchingEncoder(model)
+        return _encoders[name]
+
+
+def loaded_models():
+    with _registry_lock:
+        return {name: dict(encoder.stats(), backend=EMBED_BACKEND) for name, encoder in _encoders.items()}
+
+
+# Shared per-process cache for query embeddings
+query_cache = QueryEmbeddingCache()
@@ -1,18 +1,22 @@
 import os
-import json
-import re
-import subprocess
 import dateparser
-from datetime import datetime
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.vectorstores import Neo4jVector
 from langchain.chains import RetrievalQA
 from langchain.llms import Ollama
 from langchain_neo4j import Neo4jVector
+from log_index import LogIndex, extract_filters
+from records import RenderedEntries
+from ingest import iter_records
+from doc_store import DocStore
+from embedding_cache import open_cache
+from embeddings import BatchedEmbeddings, get_encoder
+from llm_client import ollama, ask_ollama
+import executors
+from executors import run_cpu, run_io
 
 
 # -------- CONFIG --------
@@ -24,6 +28,7 @@ NEO4J_USERNAME = "neo4j"
 NEO4J_PASSWORD = "purva@1234"
 COLLECTION_NAME = "vectorbot"
 LOCAL_MODEL_PATH = "all-MiniLM-L6-v2" 
+PROMPT_ENTRIES = 10  # filtered entries placed in the LLM prompt
 
 load_dotenv(".env.local")
 DEFAULT_OLLAMA_MODEL = os.getenv("NEXT_PUBLIC_DEFAULT_MODEL", "Gemma3:1b")
@@ -39,13 +44,9 @@ def normalize_dates(text):
     parsed = dateparser.parse(text)
     return parsed.strftime("%Y-%m-%d") if parsed else text
 
-def ask_ollama(prompt: str, model: str) -> str:
-    result = subprocess.run(["ollama", "run", model], input=prompt.encode(), stdout=subprocess.PIPE)
-    return result.stdout.decode().strip()
-
 def load_json_data():
-    with open(DATA_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """Records from data.json (JSON array or NDJSON), streamed one at a time."""
+    return iter_records(DATA_PATH)
 
 def json_to_text_entries(data):
     text_entries = []
@@ -63,7 +64,7 @@ def json_to_text_entries(data):
     return text_entries
 
 def setup_vectorstore():
-    embeddings = HuggingFaceEmbeddings(model_name=LOCAL_MODEL_PATH)
+    embeddings = BatchedEmbeddings(get_encoder(LOCAL_MODEL_PATH), cache=open_cache(LOCAL_MODEL_PATH))
 
     db = Neo4jVector.from_texts(
         texts=json_to_text_entries(load_json_data()),
@@ -83,11 +84,12 @@ def setup_vectorstore():
 
 
 def init_vector_store():
-    raw_data = load_json_data()
+    raw_data = list(load_json_data())
     texts = json_to_text_entries(raw_data)
     metadata = raw_data
 
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    # Entries already embedded by an earlier start are read from the on-disk cache
+    embeddings = BatchedEmbeddings(get_encoder(EMBEDDING_MODEL), cache=open_cache(EMBEDDING_MODEL))
     vectorstore = Neo4jVector.from_texts(
         texts,
         embedding=embeddings,
@@ -98,43 +100,35 @@ def init_vector_store():
         database="neo4j",
         index_name=COLLECTION_NAME
     )
-    return vectorstore.as_retriever(), raw_data
+    # Keep the records column-encoded; the dicts are only needed for the Neo4j upload
+    return vectorstore.as_retriever(), DocStore.from_records(raw_data)
 
 retriever, docs = init_vector_store()
+log_index = LogIndex(docs)
+entries = RenderedEntries(docs)
 
-def doc_to_entry(d):
-    location = d.get("LocationCode", "").replace("LOC-IN-", "")
-    date = d.get("RecordDate", "unknown date")
-    time = d.get("Time", "")
-    hour = int(datetime.strptime(time, "%H:%M:%S").hour) if time else None
-    part = (
-        "morning" if 5 <= hour < 12 else
-        "afternoon" if 12 <= hour < 17 else
-        "evening" if 17 <= hour < 21 else
-        "night"
-    ) if hour is not None else ""
-    return (
-        f"On {d.get('DayOfWeek', '')}, {date} at {d.get('SiteDetails', '')} "
-        f"({d.get('Floor', '')}, {location}), WiFi count: {d.get('WiFiCount', 'N/A')}, "
-        f"Access count: {d.get('AccessControlCount', 'N/A')}, Type: {d.get('DayType', '')}, "
-        f"TimeSlot: {d.get('TimeSlot', '')}. Part of day: {part}."
-    )
 
+@app.on_event("shutdown")
+async def close_llm_client():
+    await ollama.aclose()
+    executors.shutdown()
 
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "service": "Graph Chatbot"}
 
-@app.post("/query")
-def query(req: QueryRequest):
-    norm_q = normalize_dates(req.question).lower()
-    filtered_docs = filter_logs(docs, norm_q)
-
-    if not filtered_docs:
+def retrieve(norm_q):
+    filters = extract_filters(norm_q)
+    rows = log_index.lookup(filters) if filters else []
+    if not len(rows):
         results = retriever.get_relevant_documents(norm_q)
-        results = [doc.page_content for doc in results]
-    else:
-        results = [doc_to_entry(d) for d in filtered_docs]
+        return [doc.page_content for doc in results]
+    return entries.render(rows[:PROMPT_ENTRIES])
+
+@app.post("/query")
+async def query(req: QueryRequest):
+    norm_q = (await run_cpu(normalize_dates, req.question)).lower()
+    results = await run_io(retrieve, norm_q)
 
     prompt = f"""You are an expert log analyst. Use the following context to answer the question.
 
@@ -145,7 +139,7 @@ Question: {norm_q}
 Answer:"""
 
     model_name = req.model or DEFAULT_OLLAMA_MODEL
-    answer = ask_ollama(prompt, model_name)
-    critique = ask_ollama(f"Critique the following answer:\n{answer}", model_name)
+    answer = await ask_ollama(prompt, model_name)
+    critique = await ask_ollama(f"Critique the following answer:\n{answer}", model_name)
 
     return {"answer": answer, "critique": critique, "rewritten_query": norm_q}
\ No newline at end of file
@@ -0,0 +1,179 @@
+import os
+import resource
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from index_types import RAG_PCA_DIM, new_index, train_rows
+
+# -------- CONFIG --------
+RAG_BUILD_CHUNK = int(os.getenv("RAG_BUILD_CHUNK", "4096"))  # texts encoded and added to the index per step
+# Encoder processes for large builds; 1 encodes in this process
+RAG_BUILD_PROCESSES = int(os.getenv("RAG_BUILD_PROCESSES", str(os.cpu_count() or 1)))
+# Below this many texts, starting a process pool (one model copy each) costs more than it saves
+RAG_POOL_MIN_TEXTS = int(os.getenv("RAG_POOL_MIN_TEXTS", "20000"))
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of finished child processes, in MB."""
+    scale = 1 / 1024 ** 2 if sys.platform == "darwin" else 1 / 1024  # bytes on macOS, KB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return round(own, 1), round(children, 1)
+
+
+def process_memory_mb(pid="self"):
+    """Current RSS of a process in MB, split into private (anon) and file-backed pages.
+
+    File-backed pages, such as a memory-mapped index, are shared with other
+    processes mapping the same file. pss_mb charges each shared page (including
+    copy-on-write pages inherited across fork) proportionally to its sharers, so
+    summing it over processes gives their real total. Linux only; elsewhere
+    only this process's peak RSS is known.
+    """
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return {"rss_mb": peak_rss_mb()[0]}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r", encoding="utf-8") as f:
+            fields.update(line.split(":", 1) for line in f if line.startswith("Pss:"))
+    except OSError:
+        pass
+
+    def mb(key):
+        return round(int(fields.get(key, "0 kB").split()[0]) / 1024, 1)
+
+    memory = {"rss_mb": mb("VmRSS"), "private_mb": mb("RssAnon"), "shared_mb": mb("RssFile") + mb("RssShmem")}
+    if "Pss" in fields:
+        memory["pss_mb"] = mb("Pss")
+    return memory
+
+
+class ChunkEncoder:
+    """Encodes texts chunk by chunk, fanning each chunk out to a process pool when worth it.
+
+    `total` is the number of texts the build passes in. With an EmbeddingCache
+    only texts it has not seen are encoded, counted chunk by chunk in
+    `encoded`; the pool is started once the misses so far, extrapolated to
+    `total`, reach RAG_POOL_MIN_TEXTS, so a warm cache never starts it. Use as
+    a context manager so the pool's worker processes are stopped after the
+    build.
+    """
+
+    def __init__(self, model, total, processes=RAG_BUILD_PROCESSES, chunk_size=RAG_BUILD_CHUNK, cache=None):
+        self.model = model
+        self.cache = cache
+        self.chunk_size = max(1, chunk_size)
+        self.total = total
+        self.processes = processes if total >= RAG_POOL_MIN_TEXTS else 1
+        self.pool = None
+        self.seen = 0
+        self.encoded = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+    def _encode(self, texts):
+        self.encoded += len(texts)
+        if (self.pool is None and self.processes > 1 and hasattr(self.model, "start_multi_process_pool")
+                and self.encoded * self.total >= RAG_POOL_MIN_TEXTS * self.seen):
+            self.pool = self.model.start_multi_process_pool(["cpu"] * self.processes)
+        if self.pool is not None:
+            return self.model.encode_multi_process(texts, self.pool)
+        return self.model.encode(texts)
+
+    def encode(self, texts):
+        texts = list(texts)
+        self.seen += len(texts)
+        vectors = self.cache.encode(texts, self._encode) if self.cache is not None else self._encode(texts)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def chunks(self, texts):
+        """Yield (start, vectors) for consecutive chunks of `texts`."""
+        for start in range(0, len(texts), self.chunk_size):
+            yield start, self.encode(texts[start:start + self.chunk_size])
+
+
+def pick(texts, positions):
+    """texts[i] for each position; lazy text sequences (records.EntryTexts) render them in one pass."""
+    take = getattr(texts, "take", None)
+    return take(positions) if take is not None else [texts[i] for i in positions]
+
+
+def add_texts(index, encoder, texts, known=None):
+    """Encode `texts` chunk by chunk and add each chunk to `index` as it completes.
+
+    `known` maps positions in `texts` to vectors encoded earlier (the training
+    sample), which are reused instead of encoded again.
+    """
+    known = known or {}
+    for start in range(0, len(texts), encoder.chunk_size):
+        stop = min(start + encoder.chunk_size, len(texts))
+        chunk = np.empty((stop - start, index.d), dtype=np.float32)
+        todo = [i for i in range(start, stop) if i not in known]
+        for i in range(start, stop):
+            if i in known:
+                chunk[i - start] = known.pop(i)
+        if todo:
+            chunk[[i - start for i in todo]] = encoder.encode(pick(texts, todo))
+        index.add(chunk)
+
+
+def train_index(index, encoder, texts):
+    """Train `index` on a sample of `texts` when it needs training (IVF/PQ/SQ, PCA).
+
+    Returns {position in texts: vector} for the sample, so add_texts can
+    reuse those vectors instead of encoding them twice.
+    """
+    if index.is_trained or not len(texts):
+        return {}
+    rows = train_rows(len(texts))
+    sample = np.concatenate([encoder.encode(pick(texts, rows[s:s + encoder.chunk_size]))
+                             for s in range(0, len(rows), encoder.chunk_size)])
+    index.train(sample)
+    return dict(zip(rows.tolist(), sample))
+
+
+def build_stats(texts, encoder, started):
+    """Throughput and peak RSS of a build of `texts` since `started`, with the count `encoder` encoded.
+
+    Call it while `encoder` is still open, so its process pool is counted.
+    """
+    seconds = time.perf_counter() - started
+    own, children = peak_rss_mb()
+    return {
+        "texts": len(texts),
+        "encoded": encoder.encoded,
+        "processes": encoder.processes if encoder.pool is not None else 1,
+        "chunk_size": encoder.chunk_size,
+        "texts_per_s": round(len(texts) / seconds, 1) if seconds > 0 else None,
+        "peak_rss_mb": own,
+        "peak_child_rss_mb": children,
+    }
+
+
+def build_vector_index(kind, texts, model, dim, cache=None, pca_dim=RAG_PCA_DIM):
+    """Stream `texts` through a chunked, multi-process encoder into a new index of `kind`.
+
+    Only one chunk of vectors (plus the training sample for IVF/PQ/SQ indexes)
+    is held in memory at a time, and texts found in `cache` are not encoded
+    again. Returns (index, info, stats) where stats has the throughput and
+    peak RSS of the build.
+    """
+    started = time.perf_counter()
+    index, info = new_index(kind, dim, len(texts), pca_dim)
+    with ChunkEncoder(model, len(texts), cache=cache) as encoder:
+        add_texts(index, encoder, texts, train_index(index, encoder, texts))
+        stats = build_stats(texts, encoder, started)
+    return index, info, stats
@@ -0,0 +1,192 @@
+import os
+import math
+
+import faiss
+import numpy as np
+
+# -------- CONFIG --------
+# One of INDEX_TYPES; vectors are L2-normalized so inner product is cosine similarity
+RAG_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat")
+RAG_TRAIN_SAMPLE = int(os.getenv("RAG_TRAIN_SAMPLE", "50000"))
+RAG_HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+RAG_PQ_M = int(os.getenv("RAG_PQ_M", "48"))  # sub-quantizers; must divide the dimension
+# PCA-project vectors to this many dimensions before indexing; 0 keeps the full dimension
+RAG_PCA_DIM = int(os.getenv("RAG_PCA_DIM", "0"))
+# Search-time tuning recorded in the manifest at build; env values override it at load
+RAG_NPROBE = os.getenv("RAG_NPROBE")
+RAG_EF_SEARCH = os.getenv("RAG_EF_SEARCH")
+
+INDEX_TYPES = ["flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "fp16"]
+
+
+def default_nlist(n):
+    # ~4*sqrt(n) lists, but keep at least 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def pq_subquantizers(dim, m=RAG_PQ_M):
+    m = min(m, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def factory_string(kind, dim, n):
+    """faiss.index_factory description for an index type sized for n vectors."""
+    if kind == "flat":
+        return "Flat"
+    if kind == "ivf_flat":
+        return f"IVF{default_nlist(n)},Flat"
+    if kind == "ivf_pq":
+        # PQ codebooks need at least 2**nbits training points each
+        nbits = max(1, min(8, int(math.log2(max(n, 2)))))
+        return f"IVF{default_nlist(n)},PQ{pq_subquantizers(dim)}x{nbits}"
+    if kind == "hnsw":
+        return f"HNSW{RAG_HNSW_M},Flat"
+    if kind == "sq8":
+        return "SQ8"
+    if kind == "fp16":
+        return "SQfp16"
+    raise ValueError(f"Unknown index type '{kind}', expected one of {INDEX_TYPES}")
+
+
+def default_search_params(kind, n):
+    if kind in ("ivf_flat", "ivf_pq"):
+        return {"nprobe": max(1, min(default_nlist(n), 16))}
+    if kind == "hnsw":
+        return {"efSearch": 64}
+    return {}
+
+
+def apply_search_params(index, params):
+    """Set nprobe/efSearch on any index (or wrapper) that supports them."""
+    params = dict(params or {})
+    if RAG_NPROBE:
+        params["nprobe"] = int(RAG_NPROBE)
+    if RAG_EF_SEARCH:
+        params["efSearch"] = int(RAG_EF_SEARCH)
+    if hasattr(index, "set_search_params"):
+        index.set_search_params(params)  # a PartitionedIndex applies them to each partition it loads
+        return params
+    space = faiss.ParameterSpace()
+    for name, value in params.items():
+        try:
+            space.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # parameter does not apply to this index type
+    return params
+
+
+def train_rows(n, size=RAG_TRAIN_SAMPLE, seed=1234):
+    if n <= size:
+        return np.arange(n)
+    return np.sort(np.random.default_rng(seed).choice(n, size, replace=False))
+
+
+def train_sample(vectors, size=RAG_TRAIN_SAMPLE, seed=1234):
+    if len(vectors) <= size:
+        return vectors
+    return vectors[train_rows(len(vectors), size, seed)]
+
+
+def new_index(kind, dim, n, pca_dim=RAG_PCA_DIM):
+    """An empty, untrained index of the given type sized for n vectors.
+
+    With pca_dim, vectors are PCA-projected and re-normalized (so inner
+    product stays cosine similarity) before reaching the index, which is
+    wrapped in an IndexPreTransform. Returns (index, info) where info holds
+    the factory string and search params, to be persisted in the manifest.
+    """
+    if pca_dim and not 0 < pca_dim < dim:
+        raise ValueError(f"RAG_PCA_DIM must be between 1 and {dim - 1}, got {pca_dim}")
+    description = factory_string(kind, pca_dim or dim, n)
+    if pca_dim:
+        description = f"PCA{pca_dim},L2norm,{description}"
+    index = faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+    search_params = apply_search_params(index, default_search_params(kind, n))
+    return index, {"index_type": kind, "pca_dim": pca_dim, "factory": description, "search_params": search_params}
+
+
+def create_index(kind, vectors, pca_dim=RAG_PCA_DIM):
+    """Build and train an index of the given type, then add `vectors`."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    index, info = new_index(kind, dim, n, pca_dim)
+    if not index.is_trained:
+        index.train(train_sample(vectors))
+    index.add(vectors)
+    return index, info
+
+
+def split_pca(index):
+    """(inner index, PCA transform) of an index from new_index; the transform is None without PCA."""
+    if isinstance(index, faiss.IndexPreTransform):
+        return faiss.downcast_index(index.index), faiss.downcast_VectorTransform(index.chain.at(0))
+    return index, None
+
+
+def with_pca(index, pca):
+    """Put `pca` (and the re-normalization after it) back in front of an inner index."""
+    if pca is None:
+        return index
+    if pca.d_out != index.d:
+        raise ValueError(f"PCA projects to {pca.d_out} dims but the index has {index.d}")
+    wrapped = faiss.IndexPreTransform(index)
+    wrapped.prepend_transform(faiss.NormalizationTransform(pca.d_out))
+    wrapped.prepend_transform(pca)
+    return wrapped
+
+
+def clone_index(index):
+    """faiss.clone_index, also for PCA-wrapped indexes (FAISS cannot clone their L2norm step)."""
+    inner, pca = split_pca(index)
+    if pca is None:
+        return faiss.clone_index(inner)
+    # The original wrapper frees its transform with it, so the copy needs its own
+    writer = faiss.VectorIOWriter()
+    faiss.write_VectorTransform(pca, writer)
+    reader = faiss.VectorIOReader()
+    reader.data = writer.data
+    return with_pca(faiss.clone_index(inner), faiss.read_VectorTransform(reader))
+
+
+def selector_params(index, selector, full_probe=False):
+    """SearchParameters restricting `index` to `selector`, keeping its nprobe/efSearch."""
+    if isinstance(index, faiss.IndexPreTransform):
+        inner = selector_params(split_pca(index)[0], selector, full_probe)
+        params = faiss.SearchParametersPreTransform(index_params=inner)
+        params.referenced_objects = [inner]
+        return params
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nlist if full_probe else ivf.nprobe)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def filtered_search(index, query_vector, rows, k, return_scores=False):
+    """Top-k row ids by similarity, searching only inside `rows`.
+
+    Uses a FAISS ID selector so distances are only computed for the subset.
+    IVF indexes may not probe the lists holding a small subset, so a short
+    result is retried once with every list probed. With return_scores,
+    returns (scores, ids).
+    """
+    if hasattr(index, "filtered_search"):
+        return index.filtered_search(query_vector, rows, k, return_scores)
+    k = min(k, len(rows))
+    if k <= 0:
+        empty = np.empty(0, dtype=np.int64)
+        return (empty.astype(np.float32), empty) if return_scores else empty
+    query = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+    selector = faiss.IDSelectorBatch(np.asarray(rows, dtype=np.int64))
+    D, I = index.search(query, k, params=selector_params(index, selector))
+    if (I[0] < 0).any() and faiss.try_extract_index_ivf(index) is not None:
+        D, I = index.search(query, k, params=selector_params(index, selector, full_probe=True))
+    found = I[0] >= 0
+    return (D[0][found], I[0][found]) if return_scores else I[0][found]
+
+
+def index_memory_bytes(index):
+    return int(faiss.serialize_index(index).nbytes)
@@ -0,0 +1,137 @@
+import io
+import os
+import re
+import json
+from itertools import islice
+
+# -------- CONFIG --------
+INGEST_READ_SIZE = int(os.getenv("INGEST_READ_SIZE", str(1 << 20)))  # characters read per step
+INGEST_BATCH = int(os.getenv("INGEST_BATCH", "10000"))  # records handed to consumers at a time
+# Files with these suffixes hold one JSON record per line; others are sniffed
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+
+_WHITESPACE = " \t\r\n"
+_SKIP_WS = re.compile(r"[ \t\r\n]*")
+
+
+def is_ndjson(path):
+    """NDJSON by suffix, otherwise by content: a JSON export starts with '['."""
+    if path.endswith(NDJSON_SUFFIXES):
+        return True
+    with open(path, "r", encoding="utf-8-sig") as f:
+        while True:
+            ch = f.read(1)
+            if not ch:
+                return False
+            if ch not in _WHITESPACE:
+                return ch != "["
+
+
+def iter_ndjson(f):
+    for number, line in enumerate(f, 1):
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Invalid JSON on line {number}: {e}") from None
+
+
+def iter_json_array(f, read_size=INGEST_READ_SIZE):
+    """Yield the elements of a top-level JSON array without reading the whole file.
+
+    Elements are decoded one at a time with raw_decode from a buffer refilled
+    in read_size steps, so memory holds one buffer plus the current element.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(read_size)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def next_char():
+        """Skip whitespace and return the next character, or '' at end of file."""
+        nonlocal pos
+        while True:
+            pos = _SKIP_WS.match(buf, pos).end()
+            if pos < len(buf) or eof:
+                return buf[pos] if pos < len(buf) else ""
+            fill()
+
+    fill()
+    if next_char() != "[":
+        raise ValueError("Expected a JSON array of records")
+    pos += 1
+    if next_char() == "]":
+        return
+    while True:
+        next_char()
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+            # A value cut by the buffer edge can still decode ("12" of "12.5"),
+            # so only accept it once the following separator is in the buffer
+            after = _SKIP_WS.match(buf, end).end()
+            if not eof and buf[after:after + 1] not in (",", "]"):
+                raise ValueError("incomplete")
+        except ValueError:
+            if eof:
+                raise ValueError(f"Invalid or truncated JSON near: {buf[pos:pos + 80]!r}") from None
+            fill()
+            continue
+        pos = end
+        yield item
+        sep = next_char()
+        pos += 1
+        if sep == "]":
+            return
+        if sep != ",":
+            raise ValueError(f"Expected ',' or ']' in JSON array, found {sep!r}")
+
+
+class _HashingReader(io.RawIOBase):
+    """Byte stream that feeds everything read through it to a hashlib digest."""
+
+    def __init__(self, raw, digest):
+        self.raw = raw
+        self.digest = digest
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.raw.readinto(buffer)
+        if n:
+            self.digest.update(memoryview(buffer)[:n])
+        return n
+
+
+def iter_records(path, digest=None):
+    """Records from a JSON array file or an NDJSON file, one at a time.
+
+    With `digest` (a hashlib object), every byte of the file is fed to it as it
+    is read, so it hashes exactly the content the records were parsed from.
+    """
+    ndjson = is_ndjson(path)
+    with open(path, "rb") as raw:
+        source = io.BufferedReader(_HashingReader(raw, digest)) if digest is not None else raw
+        f = io.TextIOWrapper(source, encoding="utf-8-sig")
+        if ndjson:
+            yield from iter_ndjson(f)
+        else:
+            yield from iter_json_array(f)
+        if digest is not None:
+            while source.read(INGEST_READ_SIZE):  # whatever follows the closing bracket
+                pass
+
+
+def batched(records, size=INGEST_BATCH):
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,97 @@
+import os
+import json
+import httpx
+from dotenv import load_dotenv
+
+# -------- CONFIG --------
+load_dotenv(".env.local")
+OLLAMA_URL = os.getenv("NEXT_PUBLIC_OLLAMA_API_URL", "http://localhost:11434")
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "300"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16"))
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "10m")
+
+# Per-model generation options forwarded as the "options" field of /api/generate,
+# as a JSON object or the path of a JSON file, e.g. '{"llama3:8b": {"num_ctx": 4096}}'.
+# Keys are matched case-insensitively against the requested model name; models
+# without an entry run with Ollama's own defaults.
+OLLAMA_MODEL_OPTIONS = os.getenv("OLLAMA_MODEL_OPTIONS", "")
+
+
+def load_model_options(value=OLLAMA_MODEL_OPTIONS):
+    """{model: options} from a JSON string or JSON file; empty when unset."""
+    value = value.strip()
+    if not value:
+        return {}
+    if not value.startswith("{"):
+        with open(value, "r", encoding="utf-8") as f:
+            value = f.read()
+    options = json.loads(value)
+    if not isinstance(options, dict) or not all(isinstance(v, dict) for v in options.values()):
+        raise ValueError("OLLAMA_MODEL_OPTIONS must map model names to option objects")
+    return options
+
+
+MODEL_OPTIONS = load_model_options()
+
+
+class OllamaClient:
+    """Async client for Ollama's /api/generate over a pooled keep-alive connection."""
+
+    def __init__(self, base_url=OLLAMA_URL, connect_timeout=OLLAMA_CONNECT_TIMEOUT,
+                 read_timeout=OLLAMA_READ_TIMEOUT, max_connections=OLLAMA_MAX_CONNECTIONS,
+                 model_options=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        model_options = MODEL_OPTIONS if model_options is None else model_options
+        self.model_options = {k.lower(): v for k, v in model_options.items()}
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so the pool binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=self.timeout, limits=self.limits
+            )
+        return self._client
+
+    def _payload(self, prompt: str, model: str, stream: bool, options=None) -> dict:
+        merged = dict(self.model_options.get(model.lower(), {}))
+        merged.update(options or {})
+        payload = {"model": model, "prompt": prompt, "stream": stream, "keep_alive": OLLAMA_KEEP_ALIVE}
+        if merged:
+            payload["options"] = merged
+        return payload
+
+    async def generate(self, prompt: str, model: str, options=None) -> str:
+        response = await self.client.post("/api/generate", json=self._payload(prompt, model, False, options))
+        response.raise_for_status()
+        return response.json().get("response", "").strip()
+
+    async def stream_generate(self, prompt: str, model: str, options=None):
+        """Yield Ollama's NDJSON chunks as dicts; the final chunk has done=True and timing stats."""
+        async with self.client.stream(
+            "POST", "/api/generate", json=self._payload(prompt, model, True, options)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Shared per-process client used by all servers
+ollama = OllamaClient()
+
+
+async def ask_ollama(prompt: str, model: str, options=None) -> str:
+    return await ollama.generate(prompt, model, options)
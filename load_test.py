@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Load test for the unified backend: fires concurrent queries and checks that
+they overlap instead of queuing behind each other, while /health stays fast.
+
+Start the backend first:
+    python -m uvicorn backend:app --host 0.0.0.0 --port 8000
+Then run:
+    python load_test.py --endpoint /rag/query --concurrency 8
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+QUESTIONS = [
+    "What is the WiFi count on the Ground Floor of Kalwa location?",
+    "Show me occupancy data for Pune on 2025-05-26",
+    "Which floor of the Innovation Hub is busiest on weekdays?",
+    "What is the access count for Bangalore Tech Park on Monday?",
+]
+
+
+async def timed_query(client, endpoint, question, model, intervals):
+    payload = {"question": question}
+    if model:
+        payload["model"] = model
+    start = time.perf_counter()
+    response = await client.post(endpoint, json=payload)
+    end = time.perf_counter()
+    intervals.append((start, end, response.status_code))
+
+
+async def probe_health(client, stop, latencies):
+    # Health checks do no work, so their latency shows whether the loop is blocked
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/health")
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.05)
+
+
+def peak_in_flight(intervals):
+    events = sorted([(s, 1) for s, _, _ in intervals] + [(e, -1) for _, e, _ in intervals])
+    current = peak = 0
+    for _, delta in events:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        intervals, health = [], []
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe_health(client, stop, health))
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*[
+            timed_query(client, args.endpoint, QUESTIONS[i % len(QUESTIONS)], args.model, intervals)
+            for i in range(args.concurrency)
+        ])
+        wall = time.perf_counter() - wall_start
+        stop.set()
+        await prober
+
+    latencies = [end - start for start, end, _ in intervals]
+    overlap = sum(latencies) / wall if wall else 0.0
+    statuses = sorted({status for _, _, status in intervals})
+
+    print(f"Endpoint:            {args.endpoint}")
+    print(f"Requests:            {len(intervals)} (status codes: {statuses})")
+    print(f"Wall time:           {wall:.2f}s")
+    print(f"Sum of latencies:    {sum(latencies):.2f}s")
+    print(f"Mean latency:        {statistics.mean(latencies):.2f}s")
+    print(f"Overlap factor:      {overlap:.2f}x (1.0 = fully serialized)")
+    print(f"Peak in flight:      {peak_in_flight(intervals)}")
+    if health:
+        print(f"/health p50 / max:   {statistics.median(health):.1f}ms / {max(health):.1f}ms")
+
+    if args.concurrency > 1 and overlap < 1.5:
+        print("❌ Requests appear to be queuing behind each other")
+        return 1
+    print("✅ Requests overlapped")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the unified backend")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/rag/query")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import re
+import calendar
+import numpy as np
+
+# Fields that get a posting list, in the order filters are extracted
+INDEXED_FIELDS = [
+    "RecordDate", "LocationCode", "Floor", "SiteDetails",
+    "DayOfWeek", "DayType", "TimeSlot", "Time",
+]
+
+CITIES = ["pune", "mumbai", "bangalore", "kalwa"]
+SITES = ["tech park", "innovation hub", "rnd building", "admin block"]
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DAY_TYPES = ["weekday", "weekend"]
+MONTHS = [name.lower() for name in calendar.month_name[1:]]
+
+
+def normalize_time(value):
+    """"HH:MM" for "H:MM", "HH:MM" or "HH:MM:SS"; other values unchanged."""
+    return re.sub(r"\b(\d{1,2}):(\d{2})(?::\d{2})?\b", lambda m: f"{int(m.group(1)):02d}:{m.group(2)}", value)
+
+
+def normalize_value(field, value):
+    """Canonical form used both for posting-list keys and for query filter values."""
+    if field == "LocationCode":
+        return str(value or "").replace("LOC-IN-", "").upper()
+    if field == "TimeSlot":
+        return normalize_time(str(value or "").replace(" ", "").replace("–", "-").lower())
+    if field == "Time":
+        # Stored as HH:MM:SS, asked for as HH:MM
+        return normalize_time(str(value or "").strip())
+    return str(value).lower()
+
+
+def month_range(query):
+    """(first day, last day) of a month named as YYYY-MM or "may 2025", else None."""
+    match = re.search(r"\b(20\d{2})-(\d{2})\b(?!-)", query)
+    if match:
+        year, month = int(match.group(1)), int(match.group(2))
+    else:
+        match = re.search(rf"\b({'|'.join(MONTHS)})\s+(20\d{{2}})\b", query)
+        if not match:
+            return None
+        year, month = int(match.group(2)), MONTHS.index(match.group(1)) + 1
+    if not 1 <= month <= 12:
+        return None
+    last = calendar.monthrange(year, month)[1]
+    return f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-{last:02d}"
+
+
+def extract_filters(query, fields=None):
+    """Pull structured field filters out of a free-text question.
+
+    `fields` restricts which filters are extracted; by default all indexed fields are.
+    RecordDate is a date, or a (start, end) tuple for a month or several dates.
+    """
+    query = query.lower()
+    fields = set(fields or INDEXED_FIELDS)
+    filters = {}
+
+    # Extract date (YYYY-MM-DD); several dates ("from ... to ...") become the range spanning them
+    dates = sorted(set(re.findall(r"\b(20\d{2}-\d{2}-\d{2})\b", query)))
+    if len(dates) == 1:
+        filters["RecordDate"] = dates[0]
+    elif dates:
+        filters["RecordDate"] = (dates[0], dates[-1])
+    elif month_range(query):
+        filters["RecordDate"] = month_range(query)
+
+    # Extract TimeSlot (HH:MM - HH:MM); otherwise a single time (HH:MM or HH:MM:SS)
+    timeslot_match = re.search(r"(\d{1,2}:\d{2})\s*[-–]\s*(\d{1,2}:\d{2})", query)
+    time_match = re.search(r"\b(\d{1,2}:\d{2}(?::\d{2})?)\b", query)
+    if timeslot_match:
+        filters["TimeSlot"] = f"{timeslot_match.group(1)}-{timeslot_match.group(2)}"
+    elif time_match:
+        filters["Time"] = time_match.group(1)
+
+    # Extract location (city name)
+    for city in CITIES:
+        if city in query:
+            filters["LocationCode"] = city.upper()
+            break
+
+    # Extract floor (e.g., "2nd Floor", "Ground Floor", etc.)
+    floor_match = re.search(r"(\d+(?:st|nd|rd|th)\s+floor|ground floor)", query)
+    if floor_match:
+        filters["Floor"] = floor_match.group(1).title()
+
+    # Extract SiteDetails
+    for site in SITES:
+        if site in query:
+            filters["SiteDetails"] = site.title()
+            break
+
+    # Extract DayOfWeek
+    for day in DAYS:
+        if day in query:
+            filters["DayOfWeek"] = day.title()
+            break
+
+    # Extract DayType
+    for dtype in DAY_TYPES:
+        if dtype in query:
+            filters["DayType"] = dtype.title()
+            break
+
+    return {k: v for k, v in filters.items() if k in fields}
+
+
+class LogIndex:
+    """Per-field posting lists over a list of record dicts.
+
+    Each (field, normalized value) maps to a sorted int32 array of row ids, built
+    once at load time. A filter is answered by intersecting the posting lists of
+    its fields, smallest first, instead of scanning every record.
+    """
+
+    def __init__(self, docs, fields=INDEXED_FIELDS):
+        self.docs = docs
+        self.fields = list(fields)
+        self.postings = {field: {} for field in self.fields}
+        self.add(docs, start=0)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, docs, start):
+        """Index `docs` as rows start..start+len(docs)-1, appending to existing posting lists."""
+        if hasattr(docs, "factorize"):
+            self._add_columns(docs, start)
+            return
+        buckets = {field: {} for field in self.fields}
+        for row, doc in enumerate(docs, start):
+            for field in self.fields:
+                key = normalize_value(field, doc.get(field, ""))
+                buckets[field].setdefault(key, []).append(row)
+        for field, values in buckets.items():
+            postings = self.postings[field]
+            for key, rows in values.items():
+                new = np.asarray(rows, dtype=np.int32)
+                postings[key] = np.concatenate([postings[key], new]) if key in postings else new
+        self._size = start + len(docs)
+
+    def _add_columns(self, store, start):
+        """Posting lists straight from a columnar store's codes, without building record dicts."""
+        for field in self.fields:
+            codes, values = store.factorize(field, "")
+            order = np.argsort(codes, kind="stable").astype(np.int32)
+            bounds = np.flatnonzero(np.diff(codes[order])) + 1
+            groups = {}
+            for rows in np.split(order, bounds) if len(order) else []:
+                key = normalize_value(field, values[codes[rows[0]]])
+                groups.setdefault(key, []).append(rows + start)
+            postings = self.postings[field]
+            for key, parts in groups.items():
+                # Distinct raw values can normalize to one key ("Pune" / "LOC-IN-PUNE")
+                new = parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+                postings[key] = np.concatenate([postings[key], new]) if key in postings else new
+        self._size = start + len(store)
+
+    def lookup(self, filters):
+        """Sorted row ids matching every filter; all rows when there are no filters."""
+        if not filters:
+            return np.arange(len(self), dtype=np.int32)
+        lists = []
+        for field, value in filters.items():
+            if isinstance(value, tuple):
+                rows = self.range(field, *value)
+            else:
+                rows = self.postings.get(field, {}).get(normalize_value(field, value))
+            if rows is None:
+                return np.empty(0, dtype=np.int32)
+            lists.append(rows)
+        lists.sort(key=len)
+        result = lists[0]
+        for rows in lists[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, rows, assume_unique=True)
+        return result
+
+    def range(self, field, start, end):
+        """Sorted row ids whose value lies in [start, end] in string order (ISO dates); None if none do."""
+        start, end = normalize_value(field, start), normalize_value(field, end)
+        parts = [rows for key, rows in self.postings.get(field, {}).items() if start <= key <= end]
+        return np.sort(np.concatenate(parts)) if parts else None
@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+from index_builder import ChunkEncoder, add_texts, build_stats, build_vector_index, pick, train_index
+from index_types import apply_search_params, clone_index, filtered_search, new_index
+
+# -------- CONFIG --------
+# Split the RAG index into one sub-index per RecordDate "month" or "week"; empty keeps one index
+RAG_PARTITION = os.getenv("RAG_PARTITION", "")
+RAG_PARTITION_CACHE = int(os.getenv("RAG_PARTITION_CACHE", "8"))  # partitions kept loaded per process
+# Queries without a date filter search only this many of the newest partitions, which stay loaded
+RAG_PARTITION_HOT = int(os.getenv("RAG_PARTITION_HOT", "4"))
+
+PARTITION_SCHEMES = ["month", "week"]
+PARTITIONS_FILE = "partitions.json"
+UNDATED = "undated"
+TRAINED = "trained"  # file name prefix of the shared trained, empty index
+# Replaced partition files are kept this long, so processes still serving an
+# older snapshot can load them lazily
+_KEEP_REPLACED_S = 3600
+
+
+def partition_key(value, scheme):
+    """Partition of a RecordDate: "2025-05" by month, "2025-W22" (ISO week) by week."""
+    try:
+        day = date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return UNDATED
+    if scheme == "month":
+        return f"{day.year:04d}-{day.month:02d}"
+    if scheme == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year:04d}-W{week:02d}"
+    raise ValueError(f"Unknown partition scheme '{scheme}', expected one of {PARTITION_SCHEMES}")
+
+
+def group_positions(keys):
+    """{key: positions of `keys` holding it}, in sorted key order."""
+    groups = {}
+    for i, key in enumerate(keys):
+        groups.setdefault(key, []).append(i)
+    return {key: np.asarray(groups[key], dtype=np.int64) for key in sorted(groups)}
+
+
+def hot_partitions(parts, count):
+    """Positions of the `count` newest non-empty partitions, newest first; undated ones only fill spare room."""
+    order = sorted((i for i, part in enumerate(parts) if part["ntotal"]),
+                   key=lambda i: (parts[i]["key"] != UNDATED, parts[i]["key"]), reverse=True)
+    return order[:max(1, count)]
+
+
+class PartitionedIndex:
+    """Date partitions of the RAG index, searched as one index over global vector ids.
+
+    Each partition is a FAISS index of the vectors whose records fall in one
+    month or week, plus the sorted global ids of those vectors. All partitions
+    are copies of one index trained on a sample of every partition's vectors
+    (kept as the `trained` file), so they share quantizer and PCA and their
+    scores compare across partitions.
+
+    Filtered searches only touch the partitions holding the filtered vectors,
+    so a RecordDate filter routes to its month or week. Unfiltered searches
+    cover the RAG_PARTITION_HOT newest partitions, which stay loaded once
+    read; older ones are only reached through filters. Other partitions are
+    read on first use and the least recently used ones dropped beyond
+    RAG_PARTITION_CACHE, so memory follows the dates being queried rather than
+    the full history.
+    """
+
+    def __init__(self, path, meta, read, cache_size=RAG_PARTITION_CACHE, hot=RAG_PARTITION_HOT):
+        self.path = path
+        self.scheme = meta["scheme"]
+        self.parts = meta["parts"]
+        self.d = meta["d"]
+        self.ntotal = sum(part["ntotal"] for part in self.parts)
+        self.keys = [part["key"] for part in self.parts]
+        # File and build info of the shared trained index; None for builds made before it existed
+        self.trained = meta.get("trained")
+        self.cache_size = max(1, cache_size)
+        self.hot = hot_partitions(self.parts, hot)
+        self.search_params = {}
+        self._read = read
+        self._pinned = {}  # hot partitions, never evicted
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+        self.ids = [np.load(self._file(part, ".ids.npy"), mmap_mode="r") for part in self.parts]
+        self.vid_part = np.empty(self.ntotal, dtype=np.int32)
+        for i, ids in enumerate(self.ids):
+            self.vid_part[ids] = i
+
+    @classmethod
+    def open(cls, path, read):
+        """`read(index_file)` loads one partition's FAISS index."""
+        with open(os.path.join(path, PARTITIONS_FILE), "r", encoding="utf-8") as f:
+            return cls(path, json.load(f), read)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, PARTITIONS_FILE))
+
+    def _file(self, part, suffix):
+        return os.path.join(self.path, part["file"] + suffix)
+
+    def set_search_params(self, params):
+        self.search_params = dict(params)
+        with self._lock:
+            for i, index in list(self._pinned.items()) + list(self._loaded.items()):
+                apply_search_params(index, dict(self.parts[i]["search_params"], **self.search_params))
+
+    def _cached(self, i):
+        if i in self._pinned:
+            return self._pinned[i]
+        index = self._loaded.get(i)
+        if index is not None:
+            self._loaded.move_to_end(i)
+        return index
+
+    def partition(self, i):
+        """The FAISS index of partition i, loading it (and evicting the coldest) if needed.
+
+        The file is read outside the lock, so a cold load does not hold up
+        searches of loaded partitions. Threads racing to load the same
+        partition each read it, and the first one stored is kept.
+        """
+        with self._lock:
+            index = self._cached(i)
+        if index is not None:
+            return index
+        index = self._read(self._file(self.parts[i], ".index"))
+        with self._lock:
+            cached = self._cached(i)
+            if cached is not None:
+                return cached
+            apply_search_params(index, dict(self.parts[i]["search_params"], **self.search_params))
+            self.loads += 1
+            if i in self.hot:
+                self._pinned[i] = index
+                return index
+            self._loaded[i] = index
+            while len(self._loaded) > self.cache_size:
+                self._loaded.popitem(last=False)  # searches still holding it keep it alive
+                self.evictions += 1
+            return index
+
+    def search(self, x, k, params=None):
+        """faiss-style search over the hot (newest) partitions; returns (D, I) with global vector ids."""
+        x = np.asarray(x, dtype=np.float32).reshape(-1, self.d)
+        D = np.full((len(x), k), -np.inf, dtype=np.float32)
+        I = np.full((len(x), k), -1, dtype=np.int64)
+        for i in self.hot:
+            Dp, Ip = self.partition(i).search(x, min(k, self.parts[i]["ntotal"]))
+            Ip = np.where(Ip >= 0, np.asarray(self.ids[i])[np.maximum(Ip, 0)], -1)
+            Dp = np.where(Ip >= 0, Dp, -np.inf)
+            D_all, I_all = np.hstack([D, Dp]), np.hstack([I, Ip])
+            order = np.argsort(-D_all, axis=1, kind="stable")[:, :k]
+            D, I = np.take_along_axis(D_all, order, 1), np.take_along_axis(I_all, order, 1)
+        return D, I
+
+    def filtered_search(self, query_vector, vids, k, return_scores=False):
+        """Top-k of `vids`, searching each partition that holds some of them inside that subset."""
+        vids = np.asarray(vids, dtype=np.int64)
+        scores, found = [], []
+        parts = self.vid_part[vids]
+        for i in np.unique(parts):
+            wanted = vids[parts == i]
+            local = np.searchsorted(self.ids[i], wanted)
+            D, I = filtered_search(self.partition(i), query_vector, local, k, return_scores=True)
+            scores.append(D)
+            found.append(np.asarray(self.ids[i])[I])
+        scores = np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+        found = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return (scores[order], found[order]) if return_scores else found[order]
+
+    def stats(self):
+        return {
+            "scheme": self.scheme,
+            "partitions": len(self.parts),
+            "hot": [self.keys[i] for i in self.hot],
+            "loaded": [self.keys[i] for i in list(self._pinned) + list(self._loaded)],
+            "cache_size": self.cache_size,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+
+def save_partition(path, key, index, ids, info, write):
+    """Write one partition under a new file name; returns its entry for partitions.json."""
+    name = f"{key}-{time.time_ns():x}"
+    write(index, os.path.join(path, name + ".index"))
+    np.save(os.path.join(path, name + ".ids.npy"), np.asarray(ids, dtype=np.int64))
+    return {"key": key, "file": name, "ntotal": int(index.ntotal), "factory": info["factory"],
+            "search_params": info["search_params"]}
+
+
+def write_partitions(path, scheme, dim, parts, trained=None):
+    """Switch partitions.json to `parts` atomically, then drop files replaced long enough ago."""
+    previous = set()
+    if PartitionedIndex.exists(path):
+        with open(os.path.join(path, PARTITIONS_FILE), "r", encoding="utf-8") as f:
+            old = json.load(f)
+        previous = {part["file"] for part in old["parts"] + [old.get("trained") or {"file": None}]}
+    meta = {"scheme": scheme, "d": dim, "parts": sorted(parts, key=lambda part: part["key"]), "trained": trained}
+    tmp = os.path.join(path, f"{PARTITIONS_FILE}.tmp-{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, PARTITIONS_FILE))
+    live = {part["file"] for part in parts + [trained or {"file": None}]}
+    cutoff = time.time() - _KEEP_REPLACED_S
+    for entry in os.listdir(path):
+        name = entry.split(".", 1)[0]
+        if entry.startswith(PARTITIONS_FILE) or name in live:
+            continue
+        full = os.path.join(path, entry)
+        if name in previous:
+            os.utime(full)  # replaced just now: the grace period starts here
+        elif os.path.getmtime(full) < cutoff:
+            os.remove(full)
+    return meta
+
+
+def build_partitions(path, scheme, kind, texts, keys, model, dim, write, cache=None, pca_dim=0):
+    """Build one index per partition key, where keys[v] is the partition of texts[v] (vector id v).
+
+    One index sized for all the texts is trained (IVF/PQ/SQ, PCA) on a sample
+    drawn across partitions and saved empty; every partition starts as a copy
+    of it. Partitions are filled and written one at a time, so the build holds
+    a single partition in memory. Returns (info, stats) for the manifest.
+    """
+    started = time.perf_counter()
+    os.makedirs(path, exist_ok=True)
+    template, info = new_index(kind, dim, len(texts), pca_dim)
+    parts = []
+    with ChunkEncoder(model, len(texts), cache=cache) as encoder:
+        known = train_index(template, encoder, texts)
+        trained = dict(info, file=f"{TRAINED}-{time.time_ns():x}")
+        write(template, os.path.join(path, trained["file"] + ".index"))
+        for key, vids in group_positions(keys).items():
+            index = clone_index(template)
+            # The training sample's vectors are reused, not encoded again
+            reuse = {i: known.pop(v) for i, v in enumerate(vids.tolist()) if v in known}
+            add_texts(index, encoder, pick(texts, vids), reuse)
+            parts.append(save_partition(path, key, index, vids, info, write))
+            del index
+        stats = build_stats(texts, encoder, started)
+    write_partitions(path, scheme, dim, parts, trained)
+    stats["partitions"] = len(parts)
+    info = {"index_type": kind, "pca_dim": pca_dim, "factory": f"{scheme} partitions", "search_params": {}}
+    return info, stats
+
+
+def append_partitions(index, texts, vids, keys, model, write, read_private, cache=None, kind=None, pca_dim=0):
+    """Add texts (new global vector ids `vids`) to the partitions named by `keys`.
+
+    Only touched partitions are rewritten: existing ones from a private copy of
+    their file, new ones from a copy of the shared trained index (or built from
+    scratch when there is no trained one). Returns the new partitions.json meta.
+    """
+    parts = {part["key"]: part for part in index.parts}
+    positions = {key: i for i, key in enumerate(index.keys)}
+    with ChunkEncoder(model, len(texts), cache=cache) as encoder:
+        for key, group in group_positions(keys).items():
+            group_texts = [texts[i] for i in group]
+            if key in parts:
+                sub = read_private(index._file(parts[key], ".index"))
+                apply_search_params(sub, parts[key]["search_params"])
+                ids = np.concatenate([index.ids[positions[key]], vids[group]])
+            else:
+                sub = read_private(index._file(index.trained, ".index")) if index.trained else None
+                if sub is None or not sub.is_trained:
+                    sub, info, _ = build_vector_index(kind, group_texts, model, index.d, cache, pca_dim)
+                    parts[key] = save_partition(index.path, key, sub, vids[group], info, write)
+                    continue
+                ids = vids[group]
+            add_texts(sub, encoder, group_texts)
+            parts[key] = save_partition(index.path, key, sub, ids, parts.get(key, index.trained), write)
+            del sub
+    return write_partitions(index.path, index.scheme, index.d, list(parts.values()), index.trained)
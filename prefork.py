@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Pre-fork launcher for backend.py.
+
+The master process imports backend once, loading the embedding model, FAISS
+index and dataset, then forks the uvicorn workers. Workers inherit that
+read-only state copy-on-write instead of each loading its own copy:
+    python prefork.py --workers 8 --port 8000
+
+Torch/OpenMP threads are capped per worker before torch is imported (a
+threaded OpenMP pool does not survive fork), the master runs no inference and
+starts no background threads, and each worker opens its own Neo4j driver and
+RAG watcher after the fork. Worker 0 (restarted in the same slot if it dies)
+owns the RAG index: only its watcher checks the sources and rebuilds, while
+the other workers reload the snapshot when the index manifest changes.
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load backend.py once, then fork uvicorn workers")
+    parser.add_argument("--app", default="backend", help="module holding the FastAPI `app` and `after_fork`")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch/FAISS threads per worker (default: cores / workers)")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args()
+
+
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app_module, sock, args, threads, reload_interval, slot):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    app_module.after_fork(threads, reload_interval, owner=slot == 0)
+    config = uvicorn.Config(app_module.app, log_level=args.log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def memory_report(pids):
+    from index_builder import process_memory_mb
+
+    total = 0.0
+    for name, pid in pids:
+        memory = process_memory_mb(pid)
+        total += memory.get("pss_mb", memory["rss_mb"])
+        print(f"  {name:<10} pid {pid}: {memory}")
+    print(f"  total (PSS): {round(total, 1)} MB")
+
+
+def main():
+    args = parse_args()
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    # Must be set before torch/FAISS are imported to size their OpenMP pools
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, str(threads))
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    # The RAG watcher thread is started per worker after the fork, not in the master
+    reload_interval = float(os.environ.get("RAG_RELOAD_INTERVAL", "60"))
+    os.environ["RAG_RELOAD_INTERVAL"] = "0"
+
+    started = time.perf_counter()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    app_module = __import__(args.app)
+    rag = getattr(app_module, "rag", None)
+    if rag is not None:
+        rag.join_rebuild()  # never fork while a rebuild thread holds the index lock
+    print(f"Master loaded {args.app} in {time.perf_counter() - started:.1f}s")
+
+    sock = bind_socket(args.host, args.port)
+    # Move everything loaded so far out of the collector's reach, so GC passes in
+    # the workers do not touch (and copy) the inherited pages
+    gc.collect()
+    gc.freeze()
+
+    workers = {}
+    stopping = False
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(app_module, sock, args, threads, reload_interval, slot)
+            finally:
+                os._exit(0)
+        workers[pid] = slot
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(args.workers):
+        spawn(slot)
+    print(f"Forked {args.workers} workers ({threads} threads each) on {args.host}:{args.port} "
+          f"in {time.perf_counter() - started:.1f}s")
+    time.sleep(2)
+    memory_report([("master", os.getpid())] + [(f"worker {slot}", pid) for pid, slot in workers.items()])
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = workers.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"Worker {slot} (pid {pid}) exited with status {status}, restarting")
+            spawn(slot)
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,10 @@
 import os
-import json
-import faiss
 import numpy as np
-import subprocess
 import dateparser
-import re
 from fastapi import FastAPI
 from pydantic import BaseModel
 from sentence_transformers import SentenceTransformer
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
 from dotenv import load_dotenv
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
@@ -17,11 +12,19 @@ import requests
 import ssl
 from transformers import logging
 from huggingface_hub import hf_hub_download
+from log_index import extract_filters
+from rag_index import RagIndex
+from bm25 import reciprocal_rank_fusion
+from embeddings import query_cache
+from llm_client import ollama, ask_ollama
+import executors
+from executors import run_cpu
 
 # -------- CONFIG --------
 DATA_PATH = "data.json"
 INDEX_PATH = "vector.index"
-DOC_STORE_PATH = "data_store.json"
+DOC_STORE_PATH = "data_store"  # memory-mapped columnar doc store directory
+PROMPT_ENTRIES = 10  # retrieved entries placed in the LLM prompt
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 load_dotenv(".env.local")
 DEFAULT_OLLAMA_MODEL = os.getenv("NEXT_PUBLIC_DEFAULT_MODEL", "Gemma3:1b")
@@ -59,173 +62,61 @@ class QueryRequest(BaseModel):
     question: str
     model: str | None = None  # Optional model field
 
+@app.on_event("shutdown")
+async def close_llm_client():
+    await ollama.aclose()
+    executors.shutdown()
+
 def normalize_dates(text):
     parsed = dateparser.parse(text)
     return parsed.strftime("%Y-%m-%d") if parsed else text
 
-def ask_ollama(prompt: str, model: str) -> str:
-    result = subprocess.run(["ollama", "run", model], input=prompt.encode(), stdout=subprocess.PIPE)
-    return result.stdout.decode().strip()
-
-def load_json_data():
-    with open(DATA_PATH, "r") as f:
-        return json.load(f)
-
-def json_to_text_entries(data):
-    result = []
-    for d in data:
-        date = d.get("RecordDate", "unknown date")
-        time = d.get("Time", "")
-        hour = int(datetime.strptime(time, "%H:%M:%S").hour) if time else None
-        part = (
-            "morning" if 5 <= hour < 12 else
-            "afternoon" if 12 <= hour < 17 else
-            "evening" if 17 <= hour < 21 else
-            "night"
-        ) if hour is not None else ""
-
-        entry = f"""On {d.get("DayOfWeek", "")}, {date} at {d.get("SiteDetails", "")} ({d.get("Floor", "")}, {d.get("LocationCode", "").replace("LOC-IN-", "")}), 
-        WiFi count: {d.get("WiFiCount", "N/A")}, Access count: {d.get("AccessControlCount", "N/A")}, Type: {d.get("DayType", "")}, TimeSlot: {d.get("TimeSlot", "")}. Part of day: {part}."""
-        result.append(entry)
-    return result
-
-def build_index(text_data, model, original_data):
-    vectors = model.encode(text_data, normalize_embeddings=True)
-    index = faiss.IndexFlatIP(len(vectors[0]))
-    index.add(np.array(vectors))
-    faiss.write_index(index, INDEX_PATH)
-    # Save original JSON objects for filtering
-    with open(DOC_STORE_PATH, "w") as f:
-        json.dump(original_data, f)
-
-def search(query, model, index, docs, top_k=None):
-    qv = model.encode([query], normalize_embeddings=True)[0]
-    if top_k is None or top_k > len(docs):
-        top_k = len(docs)
-    D, I = index.search(np.array([qv]), top_k)
-    # Remove duplicates and keep only valid indices
-    unique_indices = []
-    seen = set()
-    for i in I[0]:
-        if i not in seen and i < len(docs):
-            unique_indices.append(i)
-            seen.add(i)
-    return [docs[i] for i in unique_indices]
-
-def filter_logs(docs, query):
-    query = query.lower()
-    filters = {}
-
-    # Extract date (YYYY-MM-DD)
-    date_match = re.search(r"\b(20\d{2}-\d{2}-\d{2})\b", query)
-    if date_match:
-        filters["RecordDate"] = date_match.group(1)
-
-    # Extract time (HH:MM or HH:MM:SS)
-    time_match = re.search(r"\b(\d{1,2}:\d{2}(?::\d{2})?)\b", query)
-    if time_match:
-        filters["Time"] = time_match.group(1)
-
-    # Extract TimeSlot (HH:MM - HH:MM)
-    timeslot_match = re.search(r"(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})", query)
-    if timeslot_match:
-        filters["TimeSlot"] = f"{timeslot_match.group(1)}-{timeslot_match.group(2)}".replace(" ", "")
-
-    # Extract location (city name)
-    for city in ["pune", "mumbai", "bangalore", "kalwa"]:
-        if city in query:
-            filters["LocationCode"] = city.upper()
-            break
-
-    # Extract floor (e.g., "2nd Floor", "Ground Floor", etc.)
-    floor_match = re.search(r"(\d+(?:st|nd|rd|th)\s+floor|ground floor)", query)
-    if floor_match:
-        filters["Floor"] = floor_match.group(1).title()
-
-    # Extract SiteDetails
-    for site in ["tech park", "innovation hub", "rnd building", "admin block"]:
-        if site in query:
-            filters["SiteDetails"] = site.title()
-            break
-
-    # Extract DayOfWeek
-    for day in ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]:
-        if day in query:
-            filters["DayOfWeek"] = day.title()
-            break
-
-    # Extract DayType
-    for dtype in ["weekday", "weekend"]:
-        if dtype in query:
-            filters["DayType"] = dtype.title()
-            break
-
-    filtered = []
-    for doc in docs:
-        match = True
-        for k, v in filters.items():
-            if k == "LocationCode":
-                loc = doc.get("LocationCode", "").replace("LOC-IN-", "").upper()
-                if loc != v:
-                    match = False
-                    break
-            elif k == "TimeSlot":
-                slot = doc.get("TimeSlot", "").replace(" ", "").replace("–", "-")
-                if slot.replace(" ", "") != v.replace(" ", ""):
-                    match = False
-                    break
-            else:
-                if str(doc.get(k, "")).lower() != v.lower():
-                    match = False
-                    break
-        if match:
-            filtered.append(doc)
-    return filtered
-
-# Init
-def init_system():
-    if not os.path.exists(INDEX_PATH):
-        raw_data = load_json_data()
-        entries = json_to_text_entries(raw_data)
-        model = SentenceTransformer(LOCAL_MODEL_PATH)  # Update SentenceTransformer initialization to use local model
-        build_index(entries, model, raw_data)  # Pass raw_data here
-
-    index = faiss.read_index(INDEX_PATH)
-    with open(DOC_STORE_PATH, "r") as f:
-        docs = json.load(f)
-    model = SentenceTransformer(LOCAL_MODEL_PATH)  # Update SentenceTransformer initialization to use local model
-    return index, docs, model
-
-index, docs, embed_model = init_system()
-
-def doc_to_entry(d):
-    # Remove LOC-IN- from LocationCode
-    location = d.get("LocationCode", "").replace("LOC-IN-", "")
-    date = d.get("RecordDate", "unknown date")
-    time = d.get("Time", "")
-    hour = int(datetime.strptime(time, "%H:%M:%S").hour) if time else None
-    part = (
-        "morning" if 5 <= hour < 12 else
-        "afternoon" if 12 <= hour < 17 else
-        "evening" if 17 <= hour < 21 else
-        "night"
-    ) if hour is not None else ""
-    return (
-        f"On {d.get('DayOfWeek', '')}, {date} at {d.get('SiteDetails', '')} "
-        f"({d.get('Floor', '')}, {location}), WiFi count: {d.get('WiFiCount', 'N/A')}, "
-        f"Access count: {d.get('AccessControlCount', 'N/A')}, Type: {d.get('DayType', '')}, "
-        f"TimeSlot: {d.get('TimeSlot', '')}. Part of day: {part}."
-    )
+def search(query, qv, snapshot, top_k=10):
+    """Row ids from dense (FAISS) search for query vector `qv` and lexical (BM25) search, fused by reciprocal rank."""
+    top_k = min(top_k, snapshot.index.ntotal)
+    if snapshot.binary is not None:
+        unique_indices = snapshot.binary.search(snapshot.index, qv, top_k)
+    else:
+        D, I = snapshot.index.search(np.array([qv]), top_k)
+        # Remove duplicates and keep only valid indices
+        unique_indices = []
+        seen = set()
+        for i in I[0]:
+            if i not in seen and 0 <= i < snapshot.index.ntotal:
+                unique_indices.append(i)
+                seen.add(i)
+    lexical = snapshot.bm25.search(query, top_k)
+    # Both rank vector ids (one per distinct text); map each back to one record row
+    return snapshot.vectors.to_rows(reciprocal_rank_fusion([unique_indices, lexical], limit=top_k))
+
+# Init: the index is rebuilt in the background and hot-swapped when data.json changes
+rag = RagIndex(DATA_PATH, INDEX_PATH, DOC_STORE_PATH, LOCAL_MODEL_PATH).open()
+rag.start_watcher()
+embed_model = rag.encoder
+
+def retrieve(norm_q, qv):
+    """Prompt entries: rows matching the question's filters, else the fused search results."""
+    snapshot = rag.current
+    filters = extract_filters(norm_q)
+    rows = snapshot.log_index.lookup(filters) if filters else []
+    if not len(rows):
+        return snapshot.entries.render(search(norm_q, qv, snapshot, top_k=PROMPT_ENTRIES))
+    return snapshot.entries.render(rows[:PROMPT_ENTRIES])
+
+@app.get("/index/status")
+def index_status():
+    return rag.status()
+
+@app.get("/cache/stats")
+def cache_stats():
+    return query_cache.stats()
 
 @app.post("/query")
-def query(req: QueryRequest):
-    norm_q = normalize_dates(req.question).lower()
-    filtered_docs = filter_logs(docs, norm_q)
-
-    if not filtered_docs:
-        results = search(norm_q, embed_model, index, docs, top_k=10)
-    else:
-        results = [doc_to_entry(d) for d in filtered_docs]
+async def query(req: QueryRequest):
+    norm_q = (await run_cpu(normalize_dates, req.question)).lower()
+    # Awaited on the event loop, so concurrent requests share one encode batch
+    qv = await query_cache.encode_async(embed_model, norm_q)
+    results = await run_cpu(retrieve, norm_q, qv)
 
     prompt = f"""You are an expert log analyst. Use the following context to answer the question.
 
@@ -238,7 +129,7 @@ Answer:"""
     # Use model from request, or fallback to default
     model_name = req.model or DEFAULT_OLLAMA_MODEL
 
-    answer = ask_ollama(prompt, model_name)
-    critique = ask_ollama(f"Critique the following answer:\n{answer}", model_name)
+    answer = await ask_ollama(prompt, model_name)
+    critique = await ask_ollama(f"Critique the following answer:\n{answer}", model_name)
 
     return {"answer": answer, "critique": critique, "rewritten_query": norm_q}
\ No newline at end of file
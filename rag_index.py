@@ -0,0 +1,902 @@
+import os
+import json
+import hashlib
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so every process acts as the owner
+    fcntl = None
+
+import faiss
+import numpy as np
+
+from binary_index import RAG_BINARY_PREFILTER, BinaryPrefilter, check_rerank_type
+from bm25 import BM25Index
+from embeddings import get_encoder, get_model, model_id
+from doc_store import DocStore, DocStoreWriter
+from embedding_cache import open_cache
+from ingest import batched, iter_records
+from index_builder import ChunkEncoder, add_texts, build_vector_index, peak_rss_mb, process_memory_mb
+from index_types import (INDEX_TYPES, RAG_INDEX_TYPE, RAG_PCA_DIM, apply_search_params, clone_index,
+                         split_pca, with_pca)
+from log_index import LogIndex
+from partitions import RAG_PARTITION, PartitionedIndex, append_partitions, build_partitions, partition_key
+from records import (RenderedEntries, doc_to_entry, render_entry, part_of_day, record_hash, record_hashes,
+                     record_key_hash, record_key_hashes)
+
+# -------- CONFIG --------
+RAG_RELOAD_INTERVAL = float(os.getenv("RAG_RELOAD_INTERVAL", "60"))  # seconds, 0 disables the watcher
+# Optional file of extra records (same format as data.json) ingested on top of it
+APPEND_PATH = os.getenv("RAG_APPEND_PATH", "data_append.json")
+# Memory-map the index file so uvicorn workers on one machine share one page-cached copy
+RAG_INDEX_MMAP = os.getenv("RAG_INDEX_MMAP", "1") == "1"
+
+# Fixed record rendered to fingerprint the entry template; any change to the
+# wording in records.render_entry changes this hash and marks the index stale.
+TEMPLATE_SAMPLE = {
+    "LocationCode": "LOC-IN-KALWA",
+    "RecordDate": "2025-01-01",
+    "Time": "09:00:00",
+    "DayOfWeek": "Wednesday",
+    "TimeSlot": "09:00 - 09:15",
+    "Floor": "Ground Floor",
+    "SiteDetails": "Tech Park",
+    "DayType": "Weekday",
+    "AccessControlCount": 1,
+    "WiFiCount": 2,
+}
+
+
+def manifest_path(index_path):
+    return index_path + ".manifest.json"
+
+
+def bm25_path(index_path):
+    return index_path + ".bm25.npz"
+
+
+def rows_path(index_path):
+    return index_path + ".rows.npy"
+
+
+def texts_path(index_path):
+    return index_path + ".texts.npy"
+
+
+def pca_path(index_path):
+    return index_path + ".pca"
+
+
+def binary_path(index_path):
+    return index_path + ".bin"
+
+
+def parts_path(index_path):
+    return index_path + ".parts"
+
+
+def owner_lock_path(index_path):
+    return index_path + ".owner.lock"
+
+
+def index_exists(index_path):
+    return os.path.exists(index_path) or PartitionedIndex.exists(parts_path(index_path))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def template_fingerprint():
+    sample = render_entry(TEMPLATE_SAMPLE, part_of_day(TEMPLATE_SAMPLE["Time"]))
+    return hashlib.sha256(sample.encode("utf-8")).hexdigest()
+
+
+def sources_sha256(paths, digests=None):
+    """Hash of the source files; `digests` maps each path to a sha256 already fed its bytes."""
+    shas = [digests[path].hexdigest() if digests is not None else file_sha256(path) for path in paths]
+    if len(paths) == 1:
+        return shas[0]
+    combined = "\n".join(f"{path}:{sha}" for path, sha in zip(paths, shas))
+    return hashlib.sha256(combined.encode("utf-8")).hexdigest()
+
+
+def source_manifest(data_sha256, model_name, index_type=RAG_INDEX_TYPE, pca_dim=RAG_PCA_DIM,
+                    binary_prefilter=RAG_BINARY_PREFILTER, partition=RAG_PARTITION):
+    """What the index should have been built from right now."""
+    return {
+        "data_sha256": data_sha256,
+        "index_type": index_type,
+        "pca_dim": pca_dim,
+        "binary_prefilter": binary_prefilter,
+        "partition": partition,
+        # Includes the inference backend when not fp32 torch, so switching it re-encodes
+        "embedding_model": model_id(model_name),
+        "template_sha256": template_fingerprint(),
+    }
+
+
+def read_manifest(index_path):
+    try:
+        with open(manifest_path(index_path), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Written before these options existed
+    manifest.setdefault("pca_dim", 0)
+    manifest.setdefault("binary_prefilter", False)
+    manifest.setdefault("partition", "")
+    return manifest
+
+
+def write_atomic(path, write):
+    """Write via a temp file in the same directory, then os.replace over `path`."""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def write_json(path, obj):
+    def write(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f)
+    write_atomic(path, write)
+
+
+def text_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class TextIds:
+    """64-bit hash of the text behind each vector id, for finding already indexed texts.
+
+    Kept sorted beside the ids, so an append looks up its new texts without
+    rendering the indexed ones; hash hits are confirmed against the text.
+    """
+
+    def __init__(self, hashes):
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+        self.order = np.argsort(self.hashes, kind="stable")
+        self.sorted = self.hashes[self.order]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @classmethod
+    def of(cls, texts):
+        return cls(np.fromiter((text_hash(t) for t in texts), dtype=np.uint64, count=len(texts)))
+
+    def find(self, texts, indexed):
+        """Vector id of each of `texts` already indexed, else -1; `indexed` renders texts by vector id."""
+        hashes = TextIds.of(texts).hashes
+        pos = np.minimum(np.searchsorted(self.sorted, hashes), max(len(self) - 1, 0))
+        vids = np.full(len(texts), -1, dtype=np.int64)
+        if not len(self):
+            return vids
+        hit = np.flatnonzero(self.sorted[pos] == hashes)
+        candidates = self.order[pos[hit]]
+        for i, vid, text in zip(hit.tolist(), candidates.tolist(), indexed.take(candidates)):
+            if text == texts[i]:
+                vids[i] = vid
+        return vids
+
+    def extended(self, texts):
+        return TextIds(np.concatenate([self.hashes, TextIds.of(texts).hashes]))
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.save(f, self.hashes)
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path))
+
+
+def group_texts(texts, known=None, indexed=None):
+    """Give every distinct text one vector id, in first-seen order.
+
+    `known` is the TextIds of already indexed texts and `indexed` their
+    renderings by vector id; new texts are numbered after them. Returns
+    (vector id per text, texts that got a new id, in id order).
+    """
+    found = known.find(texts, indexed) if known is not None else None
+    base = len(known) if known is not None else 0
+    ids = np.empty(len(texts), dtype=np.int32)
+    local, fresh = {}, []
+    for row, text in enumerate(texts):
+        if found is not None and found[row] >= 0:
+            ids[row] = found[row]
+            continue
+        vid = local.get(text)
+        if vid is None:
+            vid = local[text] = base + len(fresh)
+            fresh.append(text)
+        ids[row] = vid
+    return ids, fresh
+
+
+class VectorRows:
+    """Multimap between index vectors and record rows.
+
+    Records that render to the same text share one vector. vector_ids[row] is
+    the vector of a record; the rows of vector v are rows[offsets[v]:offsets[v + 1]],
+    the first of them (its lowest row) standing in for the group in results.
+    """
+
+    def __init__(self, vector_ids):
+        self.vector_ids = np.asarray(vector_ids, dtype=np.int32)
+        count = int(self.vector_ids.max()) + 1 if len(self.vector_ids) else 0
+        self.rows = np.argsort(self.vector_ids, kind="stable").astype(np.int32)
+        self.offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.vector_ids, minlength=count), out=self.offsets[1:])
+        self.first = self.rows[self.offsets[:-1]]
+
+    def __len__(self):
+        return len(self.first)
+
+    @classmethod
+    def identity(cls, n):
+        return cls(np.arange(n, dtype=np.int32))
+
+    def rows_of(self, vid):
+        return self.rows[self.offsets[vid]:self.offsets[vid + 1]]
+
+    def of_rows(self, rows):
+        """Distinct vector ids covering the given record rows."""
+        return np.unique(self.vector_ids[np.asarray(rows, dtype=np.int64)])
+
+    def to_rows(self, vids, rows=None):
+        """One record row per vector id; picked from `rows` when a filter subset is given."""
+        if rows is None:
+            return [int(self.first[v]) for v in vids]
+        rows = np.asarray(rows, dtype=np.int64)
+        found, first = np.unique(self.vector_ids[rows], return_index=True)
+        pick = dict(zip(found.tolist(), rows[first].tolist()))
+        return [pick[v] for v in vids if v in pick]
+
+    def texts(self, entries):
+        """The unique text behind each vector, in vector id order, rendered lazily."""
+        return entries.texts(self.first)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.save(f, self.vector_ids)
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path))
+
+
+def write_index(index, index_path):
+    """Write a FAISS index atomically; a PCA transform goes beside it so the index file can still be memory-mapped."""
+    index, pca = split_pca(index)
+    write_atomic(index_path, lambda tmp: faiss.write_index(index, tmp))
+    if pca is not None:
+        write_atomic(pca_path(index_path), lambda tmp: faiss.write_VectorTransform(pca, tmp))
+    elif os.path.exists(pca_path(index_path)):
+        os.remove(pca_path(index_path))
+
+
+def save_index(index, writer, index_path, manifest, bm25, vectors, text_ids, binary=None):
+    """Persist index, row map, text hashes, lexical index, binary codes, doc store and manifest,
+    each switched in atomically (manifest last).
+
+    `writer` is the DocStoreWriter holding the records; its version is published here.
+    A PartitionedIndex has already written its partitions; only the single-file
+    index of another layout is removed.
+    """
+    if isinstance(index, PartitionedIndex):
+        for path in (index_path, pca_path(index_path)):
+            if os.path.exists(path):
+                os.remove(path)
+    else:
+        write_index(index, index_path)
+        shutil.rmtree(parts_path(index_path), ignore_errors=True)
+    write_atomic(rows_path(index_path), vectors.save)
+    write_atomic(texts_path(index_path), text_ids.save)
+    write_atomic(bm25_path(index_path), bm25.save)
+    if binary is not None:
+        write_atomic(binary_path(index_path), binary.save)
+    elif os.path.exists(binary_path(index_path)):
+        os.remove(binary_path(index_path))
+    num_records = writer.publish()
+    manifest = dict(manifest, num_records=num_records, num_vectors=len(vectors),
+                    built_at=datetime.now(timezone.utc).isoformat(timespec="seconds"))
+    write_json(manifest_path(index_path), manifest)
+    return manifest
+
+
+class SourceRecords:
+    """Records streamed from the source files, keeping the first occurrence of each record_key.
+
+    Iterate once: afterwards `sha256` is the hash of the very bytes the
+    records were parsed from, so a source replaced mid-build cannot leave a
+    manifest that claims content the index does not hold. Duplicates are
+    found by a 64-bit hash of the key, so no record is kept.
+    """
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.sha256 = None
+
+    def __iter__(self):
+        seen, digests = set(), {}
+        for path in self.paths:
+            digests[path] = hashlib.sha256()
+            for d in iter_records(path, digests[path]):
+                key = record_key_hash(d)
+                if key not in seen:
+                    seen.add(key)
+                    yield d
+        self.sha256 = sources_sha256(self.paths, digests)
+
+
+def ingest_records(records, doc_store_path):
+    """Stream records in INGEST_BATCH batches into a new doc store version, grouping their texts.
+
+    Each batch is column-encoded, rendered, and its new texts hashed and
+    tokenized before the next is read; distinct texts are told apart by a
+    128-bit digest, so neither records nor texts are kept. Returns
+    (DocStoreWriter, its unpublished DocStore, VectorRows, TextIds, BM25Index).
+    """
+    writer = DocStoreWriter(doc_store_path)
+    digests = {}
+    vector_ids, hashes, postings = [np.zeros(0, dtype=np.int32)], [np.zeros(0, dtype=np.uint64)], []
+    for batch in batched(records):
+        writer.add(batch)
+        ids = np.empty(len(batch), dtype=np.int32)
+        fresh = []
+        for row, d in enumerate(batch):
+            text = doc_to_entry(d)
+            digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+            vid = digests.get(digest)
+            if vid is None:
+                vid = digests[digest] = len(digests)
+                fresh.append(text)
+            ids[row] = vid
+        vector_ids.append(ids)
+        hashes.append(TextIds.of(fresh).hashes)
+        postings.append(BM25Index.build(fresh))
+    docs = writer.finish()
+    bm25 = BM25Index.concat(postings or [BM25Index.build([])])
+    return writer, docs, VectorRows(np.concatenate(vector_ids)), TextIds(np.concatenate(hashes)), bm25
+
+
+def build_index(docs, vectors, model, index_path, manifest, cache=None):
+    """Encode the text of each vector in `vectors` once into a fresh index of manifest["index_type"].
+
+    Texts are rendered from `docs` as they are encoded, in chunks (across
+    processes for large builds) added as each chunk completes; texts already
+    in the embedding `cache` are not encoded again. Partitions are written
+    as they are built. Returns (index, info for the manifest, BinaryPrefilter
+    or None, stats).
+    """
+    kind = manifest.get("index_type", RAG_INDEX_TYPE)
+    pca_dim = manifest.get("pca_dim", RAG_PCA_DIM)
+    scheme = manifest.get("partition")
+    if manifest.get("binary_prefilter"):
+        # Fail before spending the encoding time
+        check_rerank_type(kind, pca_dim)
+        if scheme:
+            raise ValueError("RAG_BINARY_PREFILTER cannot be combined with RAG_PARTITION")
+    texts = vectors.texts(RenderedEntries(docs))
+    dim = model.get_sentence_embedding_dimension()
+    if scheme:
+        # Every record of a vector shares its text, and so its RecordDate
+        codes, dates = docs.factorize("RecordDate")
+        date_keys = [partition_key(date, scheme) for date in dates]
+        keys = [date_keys[code] for code in codes[vectors.first].tolist()]
+        info, stats = build_partitions(parts_path(index_path), scheme, kind, texts, keys, model, dim,
+                                       write_index, cache, pca_dim)
+        index, _ = read_index(index_path, kind)
+    else:
+        index, info, stats = build_vector_index(kind, texts, model, dim, cache, pca_dim)
+    binary = BinaryPrefilter.build(index) if manifest.get("binary_prefilter") else None
+    return index, info, binary, stats
+
+
+def mmap_flags(index_type):
+    """faiss.read_index flags that map an index of this type instead of copying it into memory.
+
+    IVF indexes map their inverted lists; flat, SQ and HNSW indexes map their
+    code arrays (IO_FLAG_MMAP_IFC, newer FAISS only). Mapped indexes are read-only.
+    """
+    if index_type in ("ivf_flat", "ivf_pq"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    return ifc | faiss.IO_FLAG_READ_ONLY if ifc else 0
+
+
+def read_index(index_path, index_type=RAG_INDEX_TYPE, mmap=RAG_INDEX_MMAP):
+    """Load an index file, with its PCA transform in front when one was saved; returns (index, mapped).
+
+    When the index was built in date partitions, returns a PartitionedIndex
+    that reads each partition file the same way on first use.
+    """
+    flags = mmap_flags(index_type) if mmap else 0
+    if PartitionedIndex.exists(parts_path(index_path)):
+        return PartitionedIndex.open(parts_path(index_path),
+                                     lambda path: read_index(path, index_type, mmap)[0]), bool(flags)
+    index = faiss.read_index(index_path, flags)
+    if os.path.exists(pca_path(index_path)):
+        index = with_pca(index, faiss.read_VectorTransform(pca_path(index_path)))
+    return index, bool(flags)
+
+
+def new_records(docs, records):
+    """Records not yet in `docs`, by record_key; None if an indexed record changed or vanished.
+
+    `records` is streamed in batches and matched by key and content hash
+    against hashes computed from the doc store columns, so only the new
+    records are kept.
+    """
+    keys = record_key_hashes(docs)
+    order = np.argsort(keys, kind="stable")
+    keys, contents = keys[order], record_hashes(docs)[order]
+    seen = np.zeros(len(keys), dtype=bool)
+    fresh = []
+    for batch in batched(records):
+        batch_keys = np.array([record_key_hash(d) for d in batch], dtype=np.uint64)
+        pos = np.minimum(np.searchsorted(keys, batch_keys), max(len(keys) - 1, 0))
+        hit = keys[pos] == batch_keys if len(keys) else np.zeros(len(batch), dtype=bool)
+        for d, indexed, i in zip(batch, hit.tolist(), pos.tolist()):
+            if not indexed:
+                fresh.append(d)
+            elif record_hash(d) != int(contents[i]):
+                return None
+            else:
+                seen[i] = True
+    return fresh if seen.all() else None
+
+
+class RagSnapshot:
+    """An index with the records, posting lists and renderings that match it.
+
+    Handlers take one snapshot per query, so a reload swapping in a new one
+    never mixes row ids from two different builds.
+    """
+
+    def __init__(self, index, docs, manifest=None, bm25=None, vectors=None, mapped=False, binary=None,
+                 text_ids=None):
+        self.index = index
+        self.mapped = mapped
+        self.binary = binary
+        self.docs = docs
+        self.log_index = LogIndex(docs)
+        self.entries = RenderedEntries(docs)
+        self.manifest = manifest or {}
+        self.vectors = vectors or VectorRows(group_texts(self.entries.texts(np.arange(len(docs))))[0])
+        self.bm25 = bm25 or BM25Index.build(self.vectors.texts(self.entries))
+        self.text_ids = text_ids or TextIds.of(self.vectors.texts(self.entries))
+
+    @classmethod
+    def load(cls, index_path, doc_store_path, mmap=RAG_INDEX_MMAP):
+        manifest = read_manifest(index_path) or {}
+        before = process_memory_mb()
+        index, mapped = read_index(index_path, manifest.get("index_type", "flat"), mmap)
+        after = process_memory_mb()
+        print(f"RAG index loaded ({'mmap' if mapped else 'private copy'}): "
+              + ", ".join(f"{k} {before[k]} -> {after[k]}" for k in after))
+        docs = DocStore.open(doc_store_path)
+        if os.path.exists(rows_path(index_path)):
+            vectors = VectorRows.load(rows_path(index_path))
+        else:
+            vectors = VectorRows.identity(len(docs))  # built before duplicate texts were collapsed
+        if len(vectors.vector_ids) != len(docs) or index.ntotal != len(vectors):
+            raise ValueError(f"{index_path} has {index.ntotal} vectors but {doc_store_path} has "
+                             f"{len(docs)} records mapped to {len(vectors)}")
+        apply_search_params(index, manifest.get("search_params"))
+        bm25 = None
+        if os.path.exists(bm25_path(index_path)):
+            bm25 = BM25Index.load(bm25_path(index_path))
+            if len(bm25) != len(vectors):
+                bm25 = None  # left over from another build; rebuilt from the entries
+        binary = None
+        if manifest.get("binary_prefilter"):
+            if os.path.exists(binary_path(index_path)):
+                binary = BinaryPrefilter.load(binary_path(index_path))
+            if binary is None or len(binary) != index.ntotal:
+                binary = BinaryPrefilter.build(index)  # missing or from another build; read back from the index
+        text_ids = None
+        if os.path.exists(texts_path(index_path)):
+            text_ids = TextIds.load(texts_path(index_path))
+            if len(text_ids) != len(vectors):
+                text_ids = None  # left over from another build; hashed from the entries
+        return cls(index, docs, manifest=manifest, bm25=bm25, vectors=vectors, mapped=mapped, binary=binary,
+                   text_ids=text_ids)
+
+    @classmethod
+    def empty(cls):
+        return cls(None, DocStore.from_records([]))
+
+
+class RagIndex:
+    """Owns the FAISS index files and hot-reloads them when the source data changes.
+
+    A manifest beside the index records the data hash, embedding model and
+    entry-template fingerprint it was built from. When they no longer match,
+    the index is refreshed on a background thread, written with atomic renames
+    and swapped in; queries already running keep the snapshot they started with.
+    Records are drawn from data.json plus the optional append file; a refresh
+    embeds only records whose key is not indexed yet.
+
+    With several processes serving the same files, only the `owner` watches
+    the sources and rebuilds; the others reload the snapshot whenever the
+    manifest on disk changes. Unless the launcher assigns the role
+    (set_owner), the processes elect the owner through a lock file beside
+    the index, and when it exits another one's watcher takes over.
+    """
+
+    def __init__(self, data_path, index_path, doc_store_path, model_name, append_path=APPEND_PATH,
+                 index_type=RAG_INDEX_TYPE, owner=None):
+        self.data_path = data_path
+        self.index_type = index_type
+        self.append_path = append_path
+        self.index_path = index_path
+        self.doc_store_path = doc_store_path
+        self.model_name = model_name
+        self._owner_lock = None
+        self._elect = owner is None
+        self.owner = self._claim_owner() if owner is None else owner
+        self.cache = open_cache(model_name)
+        self.current = RagSnapshot.empty()
+        self._rebuild_lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._refreshing = False
+        self._watcher = None
+        self._rebuild_thread = None
+        self._data_stat = None
+        self.last_check = None
+        self.last_rebuild = None
+        self.last_error = None
+
+    @property
+    def encoder(self):
+        return get_encoder(self.model_name)
+
+    def _claim_owner(self):
+        """Take a non-blocking flock on the owner lock file; returns True if this process holds it.
+
+        The lock is held until the process exits, which releases it for the next claimant.
+        """
+        if fcntl is None or self._owner_lock is not None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        f = open(owner_lock_path(self.index_path), "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._owner_lock = f
+        return True
+
+    def set_owner(self, owner):
+        """Assign the owner role, as a launcher that picks the owner itself does; ends the election."""
+        self.owner = owner
+        self._elect = False
+
+    @property
+    def sources(self):
+        paths = [self.data_path]
+        if self.append_path and os.path.exists(self.append_path):
+            paths.append(self.append_path)
+        return paths
+
+    def _sources_stat(self):
+        stats = []
+        for path in self.sources:
+            stat = os.stat(path)
+            stats.append((path, stat.st_mtime_ns, stat.st_size))
+        return stats
+
+    def is_stale(self):
+        manifest = read_manifest(self.index_path)
+        if manifest is None:
+            return True
+        expected = source_manifest(sources_sha256(self.sources), self.model_name, self.index_type)
+        return any(manifest.get(k) != v for k, v in expected.items())
+
+    def open(self):
+        """Load the index at startup, building it first if it does not exist yet."""
+        if not index_exists(self.index_path) or not DocStore.exists(self.doc_store_path):
+            if not self.owner:
+                # The watcher loads it once the owner has written it
+                print("RAG index not built yet, waiting for the owning process...")
+                return self
+            print("Building RAG index...")
+            self.rebuild()
+        else:
+            self.current = RagSnapshot.load(self.index_path, self.doc_store_path)
+            self.check()
+        return self
+
+    def _record_build(self, mode, records, embedded, started, stats=None):
+        seconds = time.perf_counter() - started
+        own, children = peak_rss_mb()
+        self.last_rebuild = {
+            "mode": mode,
+            "records": records,
+            "embedded": embedded,
+            "seconds": round(seconds, 2),
+            "records_per_s": round(records / seconds, 1) if seconds > 0 else None,
+            "peak_rss_mb": own,
+            "peak_child_rss_mb": children,
+            **({"encoder": stats} if stats else {}),
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        print(f"RAG index {mode}: embedded {embedded} unique texts for {records} records in "
+              f"{self.last_rebuild['seconds']}s ({self.last_rebuild['records_per_s']} records/s, "
+              f"peak RSS {own} MB, encoder processes {children} MB)")
+
+    def rebuild(self):
+        """Re-encode every record from the sources into a new index."""
+        with self._rebuild_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        started = time.perf_counter()
+        records = SourceRecords(self.sources)
+        writer, docs, vectors, text_ids, bm25 = ingest_records(records, self.doc_store_path)
+        manifest = source_manifest(records.sha256, self.model_name, self.index_type)
+        index, info, binary, stats = build_index(docs, vectors, get_model(self.model_name), self.index_path,
+                                                 manifest, self.cache)
+        manifest = save_index(index, writer, self.index_path, dict(manifest, **info), bm25, vectors, text_ids,
+                              binary)
+        index, mapped = self._reopen(index, manifest)
+        docs = DocStore.open(self.doc_store_path)
+        self.current = RagSnapshot(index, docs, manifest, bm25, vectors, mapped, binary, text_ids)
+        self._record_build("rebuild", len(docs), len(vectors), started, stats)
+
+    def _reopen(self, index, manifest):
+        """Swap a freshly written in-memory index for a mapping of its file, when mmap is on."""
+        if not RAG_INDEX_MMAP:
+            return index, False
+        mapped_index, mapped = read_index(self.index_path, manifest.get("index_type", self.index_type))
+        if not mapped:
+            return index, False
+        apply_search_params(mapped_index, manifest.get("search_params"))
+        return mapped_index, True
+
+    def refresh(self):
+        """Bring the index up to date, embedding only new records when that is enough.
+
+        Falls back to a full rebuild when the model or template changed, or when an
+        already indexed record was edited or removed from the sources.
+        """
+        with self._rebuild_lock:
+            started = time.perf_counter()
+            snapshot = self.current
+            manifest = source_manifest(None, self.model_name, self.index_type)
+            compatible = snapshot.index is not None and all(
+                snapshot.manifest.get(k) == manifest[k]
+                for k in ("embedding_model", "template_sha256", "index_type", "pca_dim", "binary_prefilter", "partition")
+            )
+            records = SourceRecords(self.sources)
+            fresh = new_records(snapshot.docs, records) if compatible else None
+            if fresh is None:
+                self._rebuild()
+                return
+            self._append(snapshot, fresh, dict(manifest, data_sha256=records.sha256), started)
+
+    def _append(self, snapshot, fresh, manifest, started):
+        manifest = dict(manifest, factory=snapshot.manifest.get("factory"),
+                        search_params=snapshot.manifest.get("search_params", {}))
+        # New records whose text is already indexed only extend the row map
+        vector_ids, texts = group_texts([doc_to_entry(d) for d in fresh], snapshot.text_ids,
+                                        snapshot.vectors.texts(snapshot.entries))
+        vectors = VectorRows(np.concatenate([snapshot.vectors.vector_ids, vector_ids]))
+        if isinstance(snapshot.index, PartitionedIndex):
+            index = self._append_partitions(snapshot, fresh, vectors, texts)
+        else:
+            # Copy so queries still searching the live index never see a half-applied add;
+            # trained quantizers are reused, so IVF/PQ codebooks are not retrained
+            if snapshot.mapped:
+                # Mapped indexes can be neither cloned nor added to: read a private copy of the file
+                index, _ = read_index(self.index_path, mmap=False)
+                if index.ntotal != snapshot.index.ntotal:
+                    self._rebuild()  # the file was replaced under us
+                    return
+            else:
+                index = clone_index(snapshot.index)
+            apply_search_params(index, snapshot.manifest.get("search_params"))
+            if texts:
+                with ChunkEncoder(get_model(self.model_name), len(texts), cache=self.cache) as encoder:
+                    add_texts(index, encoder, texts)
+        # Only the new texts are tokenized and hashed, and only the new records column-encoded
+        bm25 = snapshot.bm25.extended(texts)
+        text_ids = snapshot.text_ids.extended(texts)
+        binary = snapshot.binary.extended(index) if snapshot.binary is not None else None
+        writer = DocStoreWriter(self.doc_store_path, base=snapshot.docs)
+        writer.add(fresh)
+        manifest = save_index(index, writer, self.index_path, manifest, bm25, vectors, text_ids, binary)
+        index, mapped = self._reopen(index, manifest)
+        docs = DocStore.open(self.doc_store_path)
+        self.current = RagSnapshot(index, docs, manifest, bm25, vectors, mapped, binary, text_ids)
+        self._record_build("append", len(docs), len(texts), started)
+
+    def _append_partitions(self, snapshot, fresh, vectors, texts):
+        """Add the new vectors' `texts` to the date partitions of their records, rewriting only those."""
+        index_type = snapshot.manifest.get("index_type", self.index_type)
+        new = np.arange(len(snapshot.vectors), len(vectors), dtype=np.int64)
+        # A new vector's first row is always one of the fresh records
+        keys = [partition_key(fresh[vectors.first[v] - len(snapshot.docs)].get("RecordDate"), snapshot.index.scheme)
+                for v in new]
+        append_partitions(snapshot.index, texts, new, keys, get_model(self.model_name), write_index,
+                          lambda path: read_index(path, index_type, mmap=False)[0], self.cache,
+                          index_type, snapshot.manifest.get("pca_dim", 0))
+        return read_index(self.index_path, index_type)[0]
+
+    def _rebuild_in_background(self):
+        try:
+            self.refresh()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"RAG index rebuild failed: {e}")
+            return
+        finally:
+            self._refreshing = False
+        self.check()  # the sources may have changed again while refreshing
+
+    def reload(self):
+        """Swap in the snapshot on disk when its manifest differs from the one served; returns True if it did."""
+        with self._rebuild_lock:
+            manifest = read_manifest(self.index_path)
+            if manifest is None or manifest == self.current.manifest:
+                return False
+            try:
+                self.current = RagSnapshot.load(self.index_path, self.doc_store_path)
+            except (OSError, ValueError) as e:
+                # Caught between two files of a build being replaced; the next call retries
+                self.last_error = str(e)
+                return False
+        self.last_error = None
+        return True
+
+    def check(self):
+        """Start a background refresh if the index is stale; returns True if one was started.
+
+        The sources' stat is only recorded once it is known to be indexed or a
+        refresh for it starts. A change seen while a refresh is already running
+        leaves it unrecorded, so the watcher keeps checking, and the refresh
+        checks again when it finishes. A process that is not the owner only
+        reloads what the owner has written.
+        """
+        self.last_check = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        if not self.owner:
+            self.reload()
+            return False
+        try:
+            stat = self._sources_stat()  # taken before hashing, so a later change still shows
+            stale = self.is_stale()
+        except OSError as e:
+            self.last_error = str(e)
+            return False
+        with self._check_lock:
+            if not stale:
+                self._data_stat = stat
+                return False
+            if self._refreshing or self._rebuild_lock.locked():
+                return False
+            self._data_stat = stat
+            self._refreshing = True
+        print("RAG index is stale, refreshing in background...")
+        self._rebuild_thread = threading.Thread(target=self._rebuild_in_background, name="rag-rebuild", daemon=True)
+        self._rebuild_thread.start()
+        return True
+
+    def join_rebuild(self, timeout=None):
+        """Wait for a background refresh started by check(), e.g. before forking workers."""
+        if self._rebuild_thread is not None:
+            self._rebuild_thread.join(timeout)
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            # Pick up builds written by another process, or since this one was forked
+            self.reload()
+            if not self.owner and self._elect:
+                self.owner = self._claim_owner()  # the owner exited: take over
+            if not self.owner:
+                continue
+            try:
+                stat = self._sources_stat()
+            except OSError:
+                continue
+            # Only hash the sources when a size or mtime moved, or a file appeared
+            if stat != self._data_stat:
+                self.check()
+
+    def start_watcher(self, interval=RAG_RELOAD_INTERVAL):
+        if interval > 0 and self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, args=(interval,), name="rag-watcher", daemon=True)
+            self._watcher.start()
+
+    def status(self):
+        return {
+            "records": len(self.current.docs),
+            "vectors": len(self.current.vectors),
+            "index_mmap": self.current.mapped,
+            "binary_prefilter": self.current.binary is not None,
+            "partitions": self.current.index.stats() if isinstance(self.current.index, PartitionedIndex) else None,
+            "pid": os.getpid(),
+            "owner": self.owner,
+            "memory": process_memory_mb(),
+            "manifest": self.current.manifest,
+            "rebuilding": self._rebuild_lock.locked(),
+            "last_check": self.last_check,
+            "last_rebuild": self.last_rebuild,
+            "last_error": self.last_error,
+            "embedding_cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+def _load_in_worker(index_path, doc_store_path, mmap, results, done):
+    before = process_memory_mb()
+    snapshot = RagSnapshot.load(index_path, doc_store_path, mmap=mmap)
+    results.put({"before": before, "after": process_memory_mb(), "mapped": snapshot.mapped})
+    done.wait()  # stay alive so all workers hold the index at the same time
+
+
+def memory_report(index_path, doc_store_path, workers=4):
+    """Load the snapshot in `workers` processes at once, with and without mmap, and print per-worker RSS."""
+    import multiprocessing
+
+    ctx = multiprocessing.get_context("spawn")
+    for mmap in (False, True):
+        results, done = ctx.Queue(), ctx.Event()
+        procs = [ctx.Process(target=_load_in_worker, args=(index_path, doc_store_path, mmap, results, done))
+                 for _ in range(workers)]
+        for p in procs:
+            p.start()
+        reports = [results.get() for _ in procs]
+        done.set()
+        for p in procs:
+            p.join()
+        added = [{k: round(r["after"][k] - r["before"][k], 1) for k in r["after"]} for r in reports]
+        private = sum(a.get("private_mb", a["rss_mb"]) for a in added)
+        label = "mmap" if reports[0]["mapped"] else "private copy"
+        print(f"{label:>12}: per-worker RSS +{added[0]['rss_mb']} MB "
+              f"(private +{added[0].get('private_mb', '?')} MB, shared +{added[0].get('shared_mb', '?')} MB); "
+              f"private total for {workers} workers: {round(private, 1)} MB")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or incrementally update the RAG FAISS index")
+    parser.add_argument("--data", default="data.json")
+    parser.add_argument("--append", default=APPEND_PATH, help="extra records file ingested on top of --data")
+    parser.add_argument("--index", default="vector.index")
+    parser.add_argument("--doc-store", default="data_store")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--index-type", default=RAG_INDEX_TYPE, choices=INDEX_TYPES)
+    parser.add_argument("--rebuild", action="store_true", help="re-encode everything instead of appending new records")
+    parser.add_argument("--memory-report", type=int, metavar="WORKERS", default=0,
+                        help="load the index in WORKERS processes with and without mmap and report RSS")
+    args = parser.parse_args()
+
+    if args.memory_report:
+        memory_report(args.index, args.doc_store, args.memory_report)
+        raise SystemExit
+
+    rag = RagIndex(args.data, args.index, args.doc_store, args.model, append_path=args.append,
+                   index_type=args.index_type, owner=True)
+    if args.rebuild or not index_exists(args.index):
+        rag.rebuild()
+    else:
+        rag.current = RagSnapshot.load(args.index, args.doc_store)
+        rag.refresh()
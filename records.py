@@ -0,0 +1,133 @@
+import json
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+# Fields that together identify one occupancy reading
+RECORD_KEY_FIELDS = ("LocationCode", "SiteDetails", "Floor", "RecordDate", "Time")
+_RENDER_BATCH = 10000  # rows decoded from the doc store per step when iterating texts
+_MASK64 = (1 << 64) - 1
+_ABSENT = object()
+
+
+def record_key(d):
+    return tuple(str(d.get(field, "")) for field in RECORD_KEY_FIELDS)
+
+
+@lru_cache(maxsize=65536)
+def _value_hash(name, text):
+    # Values repeat across records (sites, floors, dates), so most lookups hit the cache
+    return int.from_bytes(hashlib.blake2b(f"{name}\0{text}".encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def record_key_hash(d):
+    """64-bit hash of record_key(d)."""
+    return sum(_value_hash(field, str(d.get(field, ""))) for field in RECORD_KEY_FIELDS) & _MASK64
+
+
+def record_hash(d):
+    """64-bit hash of a record's content, independent of field order."""
+    return sum(_value_hash(name, json.dumps(value, sort_keys=True)) for name, value in d.items()) & _MASK64
+
+
+def _column_hashes(docs, name, hash_value, default):
+    codes, values = docs.factorize(name, default)
+    table = np.array([0 if v is _ABSENT else hash_value(v) for v in values], dtype=np.uint64)
+    return table[codes]
+
+
+def record_key_hashes(docs):
+    """record_key_hash of every row of a DocStore, computed a column at a time."""
+    hashes = np.zeros(len(docs), dtype=np.uint64)
+    for field in RECORD_KEY_FIELDS:
+        hashes += _column_hashes(docs, field, lambda v, field=field: _value_hash(field, str(v)), "")
+    return hashes
+
+
+def record_hashes(docs):
+    """record_hash of every row of a DocStore, computed a column at a time."""
+    hashes = np.zeros(len(docs), dtype=np.uint64)
+    for field in docs.fields:
+        name = field["name"]
+        hashes += _column_hashes(docs, name, lambda v: _value_hash(name, json.dumps(v, sort_keys=True)), _ABSENT)
+    return hashes
+
+
+@lru_cache(maxsize=4096)
+def part_of_day(time_str):
+    # Time has a handful of distinct values, so each is parsed once per process
+    if not time_str:
+        return ""
+    hour = datetime.strptime(time_str, "%H:%M:%S").hour
+    return (
+        "morning" if 5 <= hour < 12 else
+        "afternoon" if 12 <= hour < 17 else
+        "evening" if 17 <= hour < 21 else
+        "night"
+    )
+
+
+def render_entry(d, part):
+    location = d.get("LocationCode", "").replace("LOC-IN-", "")
+    date = d.get("RecordDate", "unknown date")
+    return (
+        f"On {d.get('DayOfWeek', '')}, {date} at {d.get('SiteDetails', '')} "
+        f"({d.get('Floor', '')}, {location}), WiFi count: {d.get('WiFiCount', 'N/A')}, "
+        f"Access count: {d.get('AccessControlCount', 'N/A')}, Type: {d.get('DayType', '')}, "
+        f"TimeSlot: {d.get('TimeSlot', '')}. Part of day: {part}."
+    )
+
+
+def doc_to_entry(d):
+    return render_entry(d, part_of_day(d.get("Time", "")))
+
+
+class RenderedEntries:
+    """Entry texts of a DocStore's rows, rendered on demand from its columns.
+
+    Nothing is kept per record: only the rows that are read (prompt rows, or
+    texts being encoded) become dicts and strings, so processes sharing a
+    memory-mapped store do not each hold a rendering of every row.
+    """
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __getitem__(self, row):
+        return self.render([row])[0]
+
+    def render(self, rows):
+        return [doc_to_entry(d) for d in self.docs.take(rows)]
+
+    def texts(self, rows):
+        """The texts of `rows` as a lazy sequence."""
+        return EntryTexts(self, rows)
+
+
+class EntryTexts:
+    """Sequence of the entry texts of some rows, rendered a batch of rows at a time."""
+
+    def __init__(self, entries, rows):
+        self.entries = entries
+        self.rows = np.asarray(rows, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.entries.render(self.rows[i])
+        return self.entries.render([self.rows[i]])[0]
+
+    def take(self, positions):
+        """Texts at the given positions, rendered in one pass over the store."""
+        return self.entries.render(self.rows[np.asarray(positions, dtype=np.int64)])
+
+    def __iter__(self):
+        for start in range(0, len(self.rows), _RENDER_BATCH):
+            yield from self.entries.render(self.rows[start:start + _RENDER_BATCH])